@@ -0,0 +1,240 @@
+"""Incremental aggregation of evaluation logs.
+
+Replaces the parse-everything loop in evalSummary.ipynb. Parsed rows are
+cached under CACHE_DIR/aggregate (one folder per outputs directory)
+together with a manifest of each output file's mtime and size, so a rerun
+only parses files that are new or have changed. Both the old flat
+``results`` layout and the nested ``results["2-point"/"5-point"]`` layout
+are understood (see results_store.iter_answers). Metric names are
+normalized (protocols.normalize_metric), so a name saved with stray spaces
+counts as the same metric.
+
+    python aggregate.py                      # doc x metric x grader pivot per protocol
+    python aggregate.py --protocol 5-point --csv summary.csv
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import uuid
+
+import pandas as pd
+
+import config
+import protocols
+import results_store
+
+CATEGORY_COLUMNS = ["file", "evaluation_id", "doc", "grader", "protocol", "metric"]
+COLUMNS = CATEGORY_COLUMNS + ["rating"]
+
+# Files parsed per chunk before rows are turned into a typed frame
+CHUNK_FILES = 5000
+
+# Bump when parsed rows change, so cached rows are parsed again
+CACHE_VERSION = "2"
+
+
+def _cache_paths(cache_dir, outputs_dir):
+    # Keyed by the outputs directory, so scanning another folder never reuses
+    # (or overwrites) this one's rows
+    key = hashlib.sha1(f"{CACHE_VERSION}:{os.path.abspath(outputs_dir)}".encode("utf-8")).hexdigest()[:16]
+    folder = os.path.join(cache_dir or config.CACHE_DIR, "aggregate", key)
+    return folder, os.path.join(folder, "manifest.json"), os.path.join(folder, "rows.pkl")
+
+
+def _empty_frame():
+    return _typed({c: [] for c in COLUMNS})
+
+
+def _typed(columns):
+    frame = pd.DataFrame({c: pd.Categorical(columns[c]) for c in CATEGORY_COLUMNS})
+    frame["rating"] = pd.array(columns["rating"], dtype="Int8")
+    return frame
+
+
+def _concat(frames):
+    frames = [f for f in frames if len(f)]
+    if not frames:
+        return _empty_frame()
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+    out = {}
+    for c in CATEGORY_COLUMNS:
+        out[c] = pd.api.types.union_categoricals([f[c] for f in frames])
+    frame = pd.DataFrame(out)
+    frame["rating"] = pd.concat([f["rating"] for f in frames], ignore_index=True)
+    return frame
+
+
+def _parse_into(columns, path, name):
+    with open(path, "r", encoding="utf-8") as f:
+        output = json.load(f)
+    metadata = output.get("metadata", {})
+    evaluation_id = metadata.get("evaluation_id") or uuid.uuid5(results_store.IMPORT_NAMESPACE, name).hex
+    doc = metadata.get("document_name") or "Unknown"
+    grader = metadata.get("grader_name") or "Unknown"
+    for protocol, metric, answer in results_store.iter_answers(output):
+        columns["file"].append(name)
+        columns["evaluation_id"].append(evaluation_id)
+        columns["doc"].append(doc)
+        columns["grader"].append(grader)
+        columns["protocol"].append(protocol)
+        # Logs carry names like "Copyright and Data Privacy " with stray spaces
+        columns["metric"].append(protocols.normalize_metric(metric))
+        columns["rating"].append(answer.get("rating"))
+
+
+def scan(outputs_dir=None, cache_dir=None, verbose=False):
+    """Return the long-format ratings frame for every JSON file in outputs_dir.
+
+    Only new or changed files are parsed; rows of deleted files are dropped.
+    A missing outputs_dir (nothing saved yet) counts as empty.
+    """
+    outputs_dir = outputs_dir or config.RESULTS_DIR
+    folder, manifest_path, rows_path = _cache_paths(cache_dir, outputs_dir)
+
+    manifest = {}
+    frame = None
+    if os.path.exists(manifest_path) and os.path.exists(rows_path):
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            frame = pd.read_pickle(rows_path)
+        except (OSError, ValueError, EOFError):
+            manifest, frame = {}, None
+    if frame is None:
+        manifest, frame = {}, _empty_frame()
+
+    current = {}
+    try:
+        with os.scandir(outputs_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".json") and entry.is_file():
+                    stat = entry.stat()
+                    current[entry.name] = [stat.st_mtime_ns, stat.st_size]
+    except FileNotFoundError:
+        pass
+
+    stale = {name for name, sig in manifest.items() if current.get(name) != sig}
+    fresh = [name for name, sig in current.items() if manifest.get(name) != sig]
+    if not stale and not fresh:
+        return frame
+
+    if stale:
+        frame = frame[~frame["file"].isin(stale)]
+        for name in stale:
+            manifest.pop(name, None)
+
+    chunks = [frame]
+    for start in range(0, len(fresh), CHUNK_FILES):
+        columns = {c: [] for c in COLUMNS}
+        for name in fresh[start:start + CHUNK_FILES]:
+            try:
+                _parse_into(columns, os.path.join(outputs_dir, name), name)
+            except (OSError, ValueError) as e:
+                if verbose:
+                    print(f"Error parsing {name}: {e}")
+                continue
+            manifest[name] = current[name]
+        chunks.append(_typed(columns))
+    frame = _concat(chunks)
+    for c in CATEGORY_COLUMNS:
+        frame[c] = frame[c].cat.remove_unused_categories()
+
+    os.makedirs(folder, exist_ok=True)
+    frame.to_pickle(rows_path + ".tmp")
+    os.replace(rows_path + ".tmp", rows_path)
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    if verbose:
+        print(f"Parsed {len(fresh)} new/changed file(s), dropped {len(stale)} stale file(s)")
+    return frame
+
+
+def store_rows(db_path=None):
+    """Ratings saved to the SQLite results database, in the same layout as scan()."""
+    db_path = db_path or config.RESULTS_DB
+    if not os.path.exists(db_path):
+        return _empty_frame()
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = pd.read_sql_query(
+            "SELECT e.source AS file, r.evaluation_id, r.document AS doc, r.grader, r.protocol, r.metric, r.rating "
+            "FROM ratings r JOIN evaluations e USING (evaluation_id)",
+            conn,
+        )
+    finally:
+        conn.close()
+    rows["file"] = rows["file"].fillna("")
+    rows["metric"] = rows["metric"].map(protocols.normalize_metric)
+    return _typed({c: rows[c].tolist() for c in COLUMNS})
+
+
+def load(outputs_dir=None, db_path=None, cache_dir=None, include_db=True):
+    """All ratings from JSON logs plus (optionally) the results database.
+
+    Evaluations imported into the database from outputs/ keep the same
+    evaluation_id, so they are only counted once.
+    """
+    frame = scan(outputs_dir, cache_dir)
+    if include_db:
+        db = store_rows(db_path)
+        if len(db):
+            db = db[~db["evaluation_id"].isin(frame["evaluation_id"].unique())]
+            frame = _concat([frame, db])
+    return frame
+
+
+def by_protocol(frame):
+    """Split the long frame into one typed frame per protocol."""
+    return {
+        str(protocol): part.drop(columns="protocol").reset_index(drop=True)
+        for protocol, part in frame.groupby("protocol", observed=True)
+    }
+
+
+def pivot(frame):
+    """doc x metric rows, one rating column per grader (first rating wins)."""
+    ratings = (
+        frame.groupby(["doc", "metric", "grader"], observed=True, sort=True)["rating"]
+        .first()
+        .unstack("grader")
+    )
+    ratings.columns = ratings.columns.astype(str)
+    ratings.columns.name = None
+    return ratings.astype("Int8").reset_index()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize evaluation logs as a doc x metric x grader table.")
+    parser.add_argument("--outputs", default=config.RESULTS_DIR, help="Folder of JSON evaluation logs")
+    parser.add_argument("--db", default=config.RESULTS_DB, help="SQLite results database to include")
+    parser.add_argument("--no-db", action="store_true", help="Only read JSON logs")
+    parser.add_argument("--protocol", help="Only this protocol, e.g. 5-point")
+    parser.add_argument("--csv", help="Write the pivot to this CSV file instead of printing it")
+    args = parser.parse_args(argv)
+
+    frame = load(args.outputs, args.db, include_db=not args.no_db)
+    tables = []
+    for protocol, part in by_protocol(frame).items():
+        if args.protocol and protocol != args.protocol:
+            continue
+        table = pivot(part)
+        table.insert(0, "protocol", protocol)
+        tables.append(table)
+    if not tables:
+        print("No evaluations found")
+        return
+    summary = pd.concat(tables, ignore_index=True)
+    if args.csv:
+        summary.to_csv(args.csv, index=False)
+        print(f"Wrote {len(summary)} rows to {args.csv}")
+    else:
+        with pd.option_context("display.max_rows", None, "display.width", 200):
+            print(summary)
+
+
+if __name__ == "__main__":
+    main()
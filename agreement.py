@@ -0,0 +1,338 @@
+"""Inter-rater agreement over the doc x metric x grader rating matrix.
+
+Every statistic works on a float matrix with one row per rated unit
+(a document/metric pair) and one column per grader, with NaN where a grader
+did not rate that unit. Protocols are analyzed separately because their
+rating scales differ.
+
+    python agreement.py                      # summary per protocol
+    python agreement.py --bootstrap 2000     # with 95% bootstrap intervals
+"""
+import argparse
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+import aggregate
+
+# Full rating scale per protocol, so weights don't depend on which ratings
+# happen to have been used; unknown protocols fall back to observed values.
+SCALES = {
+    "2-point": (0, 1),
+    "5-point": (0, 1, 2, 3, 4, 5),
+}
+
+
+def rating_matrix(frame):
+    """Return (units, graders, matrix) for one protocol's long-format frame."""
+    table = aggregate.pivot(frame)
+    units = table[["doc", "metric"]]
+    graders = [c for c in table.columns if c not in ("doc", "metric")]
+    matrix = table[graders].to_numpy(dtype="float64", na_value=np.nan)
+    return units, graders, matrix
+
+
+@functools.lru_cache(maxsize=1)
+def _pipeline_scales():
+    # Rating values of any extra stages configured in data/protocols.json
+    import protocols
+
+    try:
+        pipeline = protocols.load_pipeline()
+    except (OSError, ValueError, KeyError):
+        return {}
+    return {stage.name: sorted({v for m in stage.metrics for v in m.values}) for stage in pipeline.stages}
+
+
+def scale_for(protocol, matrix):
+    observed = np.unique(matrix[~np.isnan(matrix)]).astype(int)
+    known = SCALES.get(protocol) or _pipeline_scales().get(protocol, ())
+    return np.union1d(known, observed)
+
+
+def _category_counts(matrix, categories):
+    # (units x categories) number of graders choosing each category
+    return (matrix[:, :, None] == np.asarray(categories)[None, None, :]).sum(axis=1)
+
+
+def _weights(categories, weights):
+    c = np.asarray(categories, dtype="float64")
+    if weights is None:
+        return 1.0 - np.eye(len(c))
+    span = (c.max() - c.min()) or 1.0
+    diff = np.abs(c[:, None] - c[None, :]) / span
+    if weights == "linear":
+        return diff
+    if weights == "quadratic":
+        return diff ** 2
+    raise ValueError(f"Unknown weights {weights!r}; expected None, 'linear' or 'quadratic'")
+
+
+def cohen_kappa(a, b, categories, weights=None):
+    """Cohen's kappa between two graders; weights=None|'linear'|'quadratic'."""
+    both = ~(np.isnan(a) | np.isnan(b))
+    if both.sum() < 2:
+        return np.nan
+    k = len(categories)
+    index = {c: i for i, c in enumerate(categories)}
+    lookup = np.vectorize(index.__getitem__, otypes=[np.int64])
+    ia, ib = lookup(a[both].astype(int)), lookup(b[both].astype(int))
+    observed = np.bincount(ia * k + ib, minlength=k * k).reshape(k, k) / both.sum()
+    expected = np.outer(observed.sum(axis=1), observed.sum(axis=0))
+    w = _weights(categories, weights)
+    disagreement_expected = (w * expected).sum()
+    if disagreement_expected == 0:
+        return np.nan
+    return 1.0 - (w * observed).sum() / disagreement_expected
+
+
+def pairwise_kappa(matrix, graders, categories, weights=None):
+    """Cohen's (or weighted) kappa for every pair of graders."""
+    rows = []
+    for i, j in combinations(range(len(graders)), 2):
+        n = int((~np.isnan(matrix[:, i]) & ~np.isnan(matrix[:, j])).sum())
+        rows.append({
+            "grader_a": graders[i],
+            "grader_b": graders[j],
+            "units": n,
+            "kappa": cohen_kappa(matrix[:, i], matrix[:, j], categories, weights),
+        })
+    return pd.DataFrame(rows, columns=["grader_a", "grader_b", "units", "kappa"])
+
+
+def _fleiss_from_sums(p_unit_sum, units, category_sums):
+    if units == 0:
+        return np.nan
+    p_cat = category_sums / category_sums.sum()
+    p_expected = (p_cat ** 2).sum()
+    if p_expected == 1:
+        return np.nan
+    return (p_unit_sum / units - p_expected) / (1 - p_expected)
+
+
+def _fleiss_terms(counts):
+    # Per-unit agreement and category counts for units rated at least twice
+    n = counts.sum(axis=1)
+    rated = n >= 2
+    p_unit = np.zeros(len(n))
+    p_unit[rated] = (counts[rated] * (counts[rated] - 1)).sum(axis=1) / (n[rated] * (n[rated] - 1))
+    return rated, p_unit
+
+
+def fleiss_kappa(matrix, categories):
+    """Fleiss' kappa, allowing a different number of graders per unit."""
+    counts = _category_counts(matrix, categories)
+    rated, p_unit = _fleiss_terms(counts)
+    return _fleiss_from_sums(p_unit.sum(), rated.sum(), counts[rated].sum(axis=0))
+
+
+def _alpha_distance(categories, marginals, level):
+    c = np.asarray(categories, dtype="float64")
+    if level == "nominal":
+        return 1.0 - np.eye(len(c))
+    if level == "interval":
+        return (c[:, None] - c[None, :]) ** 2
+    if level == "ordinal":
+        cum = np.cumsum(marginals)
+        lo = np.minimum.outer(np.arange(len(c)), np.arange(len(c)))
+        hi = np.maximum.outer(np.arange(len(c)), np.arange(len(c)))
+        between = cum[hi] - np.where(lo > 0, cum[lo - 1], 0)
+        return (between - (marginals[:, None] + marginals[None, :]) / 2) ** 2
+    raise ValueError(f"Unknown level {level!r}; expected 'nominal', 'ordinal' or 'interval'")
+
+
+def _coincidences(counts):
+    # Per-unit coincidence matrices (units x K x K) for units rated at least twice
+    m = counts.sum(axis=1)
+    rated = m >= 2
+    counts = counts[rated].astype("float64")
+    weighted = counts / (m[rated] - 1)[:, None]
+    per_unit = weighted[:, :, None] * counts[:, None, :]
+    k = counts.shape[1]
+    per_unit[:, np.arange(k), np.arange(k)] -= weighted
+    return rated, per_unit
+
+
+def _alpha_from_coincidence(coincidence, categories, level):
+    marginals = coincidence.sum(axis=1)
+    total = marginals.sum()
+    if total <= 1:
+        return np.nan
+    distance = _alpha_distance(categories, marginals, level)
+    expected = (np.outer(marginals, marginals) * distance).sum() / (total - 1)
+    if expected == 0:
+        return np.nan
+    return 1.0 - (coincidence * distance).sum() / expected
+
+
+def krippendorff_alpha(matrix, categories, level="nominal"):
+    """Krippendorff's alpha from the coincidence matrix; missing ratings allowed."""
+    counts = _category_counts(matrix, categories).astype("float64")
+    m = counts.sum(axis=1)
+    counts, m = counts[m >= 2], m[m >= 2]
+    if len(m) == 0:
+        return np.nan
+    weighted = counts / (m - 1)[:, None]
+    coincidence = weighted.T @ counts - np.diag(weighted.sum(axis=0))
+    return _alpha_from_coincidence(coincidence, categories, level)
+
+
+def metric_disagreement(units, matrix, categories):
+    """Rank metrics by how often graders disagree on them.
+
+    disagreement is the share of grader pairs (per unit, averaged over
+    documents) that chose different ratings; spread is the mean standard
+    deviation of the ratings.
+    """
+    counts = _category_counts(matrix, categories)
+    n = counts.sum(axis=1)
+    rated = n >= 2
+    pairs = n * (n - 1) / 2
+    agreeing = (counts * (counts - 1) / 2).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        disagreement = np.where(rated, 1 - agreeing / pairs, np.nan)
+    spread = np.full(len(matrix), np.nan)
+    if rated.any():
+        spread[rated] = np.nanstd(matrix[rated], axis=1)
+    per_unit = pd.DataFrame({
+        "metric": units["metric"].astype(str).to_numpy(),
+        "disagreement": disagreement,
+        "spread": spread,
+        "multi_rated": rated,
+    })
+    ranked = per_unit.groupby("metric").agg(
+        documents=("multi_rated", "sum"),
+        disagreement=("disagreement", "mean"),
+        spread=("spread", "mean"),
+    )
+    return ranked.sort_values(["disagreement", "spread"], ascending=False).reset_index()
+
+
+STATISTICS = ("fleiss_kappa", "alpha_nominal", "alpha_ordinal", "alpha_interval")
+
+
+def _document_sums(matrix, doc_codes, n_docs, categories):
+    """Per-document sums of the unit-level terms behind each statistic.
+
+    Fleiss' kappa and Krippendorff's alpha are built from sums over units, so
+    a bootstrap replicate (documents drawn with replacement) is just a
+    weighted sum of these per-document terms.
+    """
+    counts = _category_counts(matrix, categories).astype("float64")
+    k = counts.shape[1]
+    rated, p_unit = _fleiss_terms(counts)
+    fleiss_units = np.bincount(doc_codes, weights=rated, minlength=n_docs)
+    fleiss_p = np.bincount(doc_codes, weights=p_unit, minlength=n_docs)
+    fleiss_categories = np.zeros((n_docs, k))
+    np.add.at(fleiss_categories, doc_codes[rated], counts[rated])
+    alpha_rated, per_unit = _coincidences(counts)
+    coincidences = np.zeros((n_docs, k, k))
+    np.add.at(coincidences, doc_codes[alpha_rated], per_unit)
+    return fleiss_units, fleiss_p, fleiss_categories, coincidences
+
+
+def _bootstrap_worker(args):
+    # Module-level so it can run in a process pool
+    sums, categories, statistics, reps, seed = args
+    fleiss_units, fleiss_p, fleiss_categories, coincidences = sums
+    n_docs = len(fleiss_units)
+    rng = np.random.default_rng(seed)
+    # How often each document is drawn in each replicate
+    draws = rng.multinomial(n_docs, np.full(n_docs, 1.0 / n_docs), size=reps).astype("float64")
+    units = draws @ fleiss_units
+    p_sums = draws @ fleiss_p
+    category_sums = draws @ fleiss_categories
+    coincidence = np.tensordot(draws, coincidences, axes=1)
+    out = np.empty((reps, len(statistics)))
+    for r in range(reps):
+        for s, name in enumerate(statistics):
+            if name == "fleiss_kappa":
+                out[r, s] = _fleiss_from_sums(p_sums[r], units[r], category_sums[r])
+            else:
+                out[r, s] = _alpha_from_coincidence(coincidence[r], categories, name.split("_", 1)[1])
+    return out
+
+
+def bootstrap_ci(units, matrix, categories, statistics=("fleiss_kappa", "alpha_ordinal"),
+                 n_boot=1000, level=0.95, workers=None, seed=0):
+    """Percentile bootstrap intervals, resampling documents, on a process pool."""
+    unknown = set(statistics) - set(STATISTICS)
+    if unknown:
+        raise ValueError(f"Unknown statistics {sorted(unknown)}; expected some of {STATISTICS}")
+    doc_codes = pd.Categorical(units["doc"].astype(str)).codes.astype(np.int64)
+    n_docs = int(doc_codes.max()) + 1 if len(doc_codes) else 0
+    if n_docs < 2:
+        return {name: (np.nan, np.nan) for name in statistics}
+    sums = _document_sums(matrix, doc_codes, n_docs, categories)
+    workers = workers or os.cpu_count() or 1
+    per_worker = -(-n_boot // workers)
+    jobs = [
+        (sums, np.asarray(categories), tuple(statistics), min(per_worker, n_boot - w * per_worker), seed + w)
+        for w in range(workers)
+        if n_boot - w * per_worker > 0
+    ]
+    if len(jobs) == 1:
+        samples = _bootstrap_worker(jobs[0])
+    else:
+        with ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+            samples = np.vstack(list(pool.map(_bootstrap_worker, jobs)))
+    tail = (1 - level) / 2 * 100
+    lo, hi = np.nanpercentile(samples, [tail, 100 - tail], axis=0)
+    return {name: (lo[i], hi[i]) for i, name in enumerate(statistics)}
+
+
+def summarize(frame, protocol, n_boot=0, workers=None):
+    """Agreement statistics for one protocol's long-format frame."""
+    units, graders, matrix = rating_matrix(frame)
+    categories = scale_for(protocol, matrix)
+    kappas = pairwise_kappa(matrix, graders, categories)
+    summary = {
+        "protocol": protocol,
+        "graders": len(graders),
+        "units": len(units),
+        "multi_rated_units": int(((~np.isnan(matrix)).sum(axis=1) >= 2).sum()),
+        "mean_cohen_kappa": kappas["kappa"].mean() if len(kappas) else np.nan,
+        "fleiss_kappa": fleiss_kappa(matrix, categories),
+        "alpha_nominal": krippendorff_alpha(matrix, categories, "nominal"),
+    }
+    statistics = ["fleiss_kappa", "alpha_nominal"]
+    if len(categories) > 2:
+        weighted = pairwise_kappa(matrix, graders, categories, weights="quadratic")
+        summary["mean_weighted_kappa"] = weighted["kappa"].mean() if len(weighted) else np.nan
+        summary["alpha_ordinal"] = krippendorff_alpha(matrix, categories, "ordinal")
+        summary["alpha_interval"] = krippendorff_alpha(matrix, categories, "interval")
+        statistics.append("alpha_ordinal")
+    if n_boot:
+        for name, (lo, hi) in bootstrap_ci(units, matrix, categories, statistics, n_boot, workers=workers).items():
+            summary[f"{name}_ci"] = (lo, hi)
+    return summary, metric_disagreement(units, matrix, categories)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inter-rater agreement per grading protocol.")
+    parser.add_argument("--bootstrap", type=int, default=0, help="Bootstrap replicates for confidence intervals")
+    parser.add_argument("--workers", type=int, default=None, help="Processes for the bootstrap")
+    parser.add_argument("--top", type=int, default=10, help="Metrics to list in the disagreement ranking")
+    args = parser.parse_args(argv)
+
+    frame = aggregate.load()
+    for protocol, part in aggregate.by_protocol(frame).items():
+        summary, ranking = summarize(part, protocol, args.bootstrap, args.workers)
+        print(f"== {protocol}")
+        for key, value in summary.items():
+            if key == "protocol":
+                continue
+            if isinstance(value, tuple):
+                value = f"[{value[0]:.3f}, {value[1]:.3f}]"
+            elif isinstance(value, float):
+                value = f"{value:.3f}"
+            print(f"  {key}: {value}")
+        print(ranking.head(args.top).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,30 @@
 import streamlit as st
 import json
-import pandas as pd
 from datetime import datetime
 import os
 import base64
+import time
 from streamlit_pdf_viewer import pdf_viewer
 
+import autosave
+import assignments
+import catalog
+import config
+import doc_cache
+import documents
+import instrumentation
+import prefetch
+import protocols
+import results_store
+import textindex
+import textview
+
 # Set page config for wide mode
 st.set_page_config(layout="wide", page_title="Policy Grading", page_icon="📋")
 
+# No-op unless MARKSHEET_PROFILE is set (see instrumentation.py)
+instrumentation.start_run()
+
 # Add global CSS for a larger badge header
 st.markdown("""
 <style>
@@ -22,41 +38,31 @@ st.markdown("""
 # -----------------------------
 # Load grading protocols
 # -----------------------------
-@st.cache_data
-def load_protocol_5point():
-    df = pd.read_excel("data/GradingProtocol-5point.xlsx")
-    df = df[[
-        "Metric",
-        "Metric Defination",
-        "Rating 5 (max positive)",
-        "Rating 4",
-        "Rating 3",
-        "Rating 2",
-        "Rating 1",
-        "Rating 0 (N/A or absent)"
-    ]]
-    df = df.dropna(subset=["Metric"])
-    # Normalize metric names - strip regular and non-breaking spaces
-    df["Metric"] = df["Metric"].str.replace('\xa0', ' ').str.strip()
-    return df
-
-@st.cache_data
-def load_protocol_2point():
-    df = pd.read_excel("data/GradingProtocol-2point.xlsx")
-    df = df.dropna(subset=["Metric"])
-    # Normalize metric names - strip regular and non-breaking spaces
-    df["Metric"] = df["Metric"].str.replace('\xa0', ' ').str.strip()
-    return df
+# The stages listed in data/protocols.json, each compiled once from its
+# spreadsheet (see protocols.py); the immutable Pipeline is shared across
+# reruns instead of copied.
+@instrumentation.counted_loader("load_pipeline")
+@st.cache_resource
+def load_pipeline():
+    instrumentation.count("load_pipeline.miss")
+    with instrumentation.section("protocol_load"):
+        return protocols.load_pipeline()
+
+
+def current_protocol():
+    return load_pipeline()[st.session_state.stage]
+
+
+def empty_responses(protocol):
+    return {m.name: {"rating": None, "evidence": "", "notes": ""} for m in protocol.metrics}
 
 # -----------------------------
 # Session State
 # -----------------------------
-if "protocol_type" not in st.session_state:
-    st.session_state.protocol_type = "2-point"  # Always start with 2-point
-if "completed_2point" not in st.session_state:
-    st.session_state.completed_2point = False
-if "results_2point" not in st.session_state:
-    st.session_state.results_2point = {}
+if "stage" not in st.session_state:
+    st.session_state.stage = 0  # Position in the protocol pipeline
+if "results" not in st.session_state:
+    st.session_state.results = {}  # Responses of finished stages, by stage name
 if "index" not in st.session_state:
     st.session_state.index = 0
 if "grader_name" not in st.session_state:
@@ -75,30 +81,153 @@ if "show_final_screen" not in st.session_state:
     st.session_state.show_final_screen = False
 if "confirm_restart" not in st.session_state:
     st.session_state.confirm_restart = False
+if "saved_evaluation" not in st.session_state:
+    st.session_state.saved_evaluation = None
+if "viewer_highlights" not in st.session_state:
+    st.session_state.viewer_highlights = []
+if "prefetched_next" not in st.session_state:
+    st.session_state.prefetched_next = False
+
+# Hidden profiling summary, shown with ?admin=1 when profiling is enabled
+instrumentation.admin_panel(st)
 
 # -----------------------------
 # Navigation helpers
 # -----------------------------
+def check_evidence(evidence):
+    """Verify evidence against the selected document's text.
+
+    Returns (verification, status); status is "pending" while the
+    document's text index is still being built in the background, "failed"
+    if its text could not be extracted, "unsupported" for documents that are
+    not indexed (plain text), and None otherwise.
+    """
+    doc_path = st.session_state.selected_doc_path
+    if not (evidence or "").strip() or not doc_path or not os.path.exists(doc_path):
+        return None, None
+    if not textindex.indexable(doc_path):
+        return None, "unsupported"
+    try:
+        index = textindex.get_index(doc_path)
+    except textindex.ExtractionFailed:
+        return None, "failed"
+    if index is None:
+        return None, "pending"
+    with instrumentation.section("evidence_check"):
+        return index.verify(evidence), None
+
+
+def update_highlights(evidence):
+    """Highlight the evidence's passages in the document viewer.
+
+    The viewer is a separate fragment that the form cannot rerun on its own,
+    so when the highlighted passages change the whole page is rerun to redraw
+    it (measured as "highlight_change" in benchmarks/bench_app.py). Edits
+    that leave the highlights as they are rerun only the form.
+    """
+    doc_path = st.session_state.selected_doc_path
+    try:
+        index = (
+            textindex.get_index(doc_path)
+            if (evidence or "").strip() and doc_path and textindex.indexable(doc_path) else None
+        )
+    except textindex.ExtractionFailed:
+        index = None
+    annotations = index.highlights(evidence) if index else []
+    if annotations != st.session_state.viewer_highlights:
+        st.session_state.viewer_highlights = annotations
+        if annotations:
+            st.session_state.viewer_jump = annotations[0]["page"]
+        st.rerun(scope="app")
+
+
+def capture_answer(metric):
+    # Widget state holds the latest values when a navigation callback runs
+    answer = st.session_state.responses.setdefault(metric, {"rating": None, "evidence": "", "notes": ""})
+    for field in ("rating", "evidence", "notes"):
+        if f"{field}_{metric}" in st.session_state:
+            answer[field] = st.session_state[f"{field}_{metric}"]
+    verification, status = check_evidence(answer["evidence"])
+    if status != "pending":
+        answer["verification"] = verification
+    return dict(answer)
+
+
+def save_progress(protocol_name, metric, answer):
+    # One small append per move; see autosave.py. Saving also keeps the
+    # grader's assignment from lapsing.
+    if config.ASSIGNMENT_MODE == "queue":
+        assignments.renew(st.session_state.grader_name, st.session_state.document_name)
+    autosave.record(
+        st.session_state.grader_name,
+        st.session_state.document_name,
+        protocol_name,
+        metric,
+        answer,
+        current_protocol().name,
+        st.session_state.index,
+    )
+
+
+def assigned_document_picker(docs_folder):
+    """Setup-screen document choice in queue mode (see assignments.py)."""
+    grader = st.session_state.grader_name.strip()
+    lease = assignments.current(grader) if grader else None
+    if lease is None:
+        st.session_state.document_name = ""
+        st.session_state.selected_doc_path = ""
+        if st.button("Assign me a document", disabled=not grader):
+            assignments.ensure_seeded()
+            graded = results_store.get_backend().graded_documents(grader)
+            if assignments.claim(grader, exclude_stems=graded) is None:
+                st.session_state.assignment_message = "No documents need grading by you right now."
+            st.rerun()
+        message = st.session_state.pop("assignment_message", None)
+        if message:
+            st.info(message)
+        return
+
+    st.session_state.document_name = lease["document"]
+    st.session_state.selected_doc_path = os.path.join(docs_folder, lease["path"] or "")
+    minutes = max(0, int((lease["expires_at"] - time.time()) // 60))
+    st.success(f"📄 Your assigned document: **{lease['path']}**")
+    st.caption(f"Reserved for you for another {minutes} min; saving progress extends it.")
+    if st.button("Skip this document"):
+        assignments.skip(grader, lease["document"])
+        st.rerun()
+
+
+def prefetch_next_document():
+    """Prepare the document this grader will most likely open next, once per evaluation."""
+    if st.session_state.prefetched_next:
+        return
+    st.session_state.prefetched_next = True
+    grader = st.session_state.grader_name
+    exclude = results_store.get_backend().graded_documents(grader) | {st.session_state.document_name}
+    if config.ASSIGNMENT_MODE == "queue":
+        upcoming = assignments.peek(grader, exclude_stems=exclude)
+    else:
+        rows, _ = catalog.search("", page=0, page_size=1, exclude_stems=exclude)
+        upcoming = rows[0] if rows else None
+    if upcoming:
+        prefetch.prefetch(os.path.join(config.DOCS_DIR, upcoming["path"]))
+
+
 def next_metric():
-    protocol = load_protocol_5point() if st.session_state.protocol_type == "5-point" else load_protocol_2point()
+    pipeline = load_pipeline()
+    protocol = pipeline[st.session_state.stage]
+    left_metric = protocol[st.session_state.index].name
+    answer = capture_answer(left_metric)
     if st.session_state.index < len(protocol) - 1:
         st.session_state.index += 1
-    elif st.session_state.protocol_type == "2-point" and not st.session_state.completed_2point:
-        # Seamlessly transition from 2-point to 5-point grading
-        st.session_state.results_2point = st.session_state.responses.copy()
-        st.session_state.completed_2point = True
-        st.session_state.protocol_type = "5-point"
+        save_progress(protocol.name, left_metric, answer)
+    elif st.session_state.stage < len(pipeline) - 1:
+        # Seamlessly move on to the next stage of the pipeline
+        st.session_state.results[protocol.name] = st.session_state.responses.copy()
+        st.session_state.stage += 1
         st.session_state.index = 0
-        # Initialize responses for 5-point protocol
-        protocol_5point = load_protocol_5point()
-        st.session_state.responses = {
-            row.Metric: {
-                "rating": None,
-                "evidence": "",
-                "notes": ""
-            }
-            for _, row in protocol_5point.iterrows()
-        }
+        save_progress(protocol.name, left_metric, answer)
+        st.session_state.responses = empty_responses(pipeline[st.session_state.stage])
         # Clear widget states
         for k in [k for k in list(st.session_state.keys()) if k.startswith(("evidence_", "notes_", "rating_"))]:
             del st.session_state[k]
@@ -107,7 +236,40 @@ def next_metric():
 
 def prev_metric():
     if st.session_state.index > 0:
+        protocol = current_protocol()
+        left_metric = protocol[st.session_state.index].name
+        answer = capture_answer(left_metric)
         st.session_state.index -= 1
+        save_progress(protocol.name, left_metric, answer)
+
+
+def resume_session(session):
+    """Restore session state from a replayed autosave log."""
+    pipeline = load_pipeline()
+    results = session["results"]
+    try:
+        stage = pipeline.index_of(session["protocol"])
+    except KeyError:
+        # Logged against a stage that is no longer configured
+        stage = 0
+    protocol = pipeline[stage]
+    responses = empty_responses(protocol)
+    responses.update(results.get(protocol.name, {}))
+
+    for k in [k for k in list(st.session_state.keys()) if k.startswith(("evidence_", "notes_", "rating_"))]:
+        del st.session_state[k]
+    st.session_state.tag = session["tag"] or ""
+    st.session_state.selected_doc_path = session["doc_path"]
+    st.session_state.results = {
+        done.name: results.get(done.name, {}) for done in pipeline.stages[:stage]
+    }
+    st.session_state.stage = stage
+    st.session_state.responses = responses
+    st.session_state.index = min(session["index"], len(protocol) - 1)
+    st.session_state.prefetched_next = False
+    st.session_state.viewer_highlights = []
+    st.session_state.pop("viewer_jump", None)
+    st.session_state.started = True
 
 # -----------------------------
 # UI
@@ -117,75 +279,126 @@ if not st.session_state.started:
     with col1:
         st.title("Grading Setup")
         
-        # Show which protocol they're about to complete - only for initial start
-        if not st.session_state.completed_2point:
-            # st.info("📋 Step 1 of 2: You will first complete the 2-point grading protocol.")
-            
-            st.session_state.grader_name = st.text_input("Grader's initials", value=st.session_state.grader_name)
-            
-            # Check if docs folder exists and get available files
-            docs_folder = "docs"
-            available_docs = []
-            if os.path.exists(docs_folder):
-                available_docs = [f for f in os.listdir(docs_folder) if os.path.isfile(os.path.join(docs_folder, f))]
-                available_docs.sort()
-            
-            if available_docs:
+        # st.info("📋 Step 1 of 2: You will first complete the 2-point grading protocol.")
+        
+        st.session_state.grader_name = st.text_input("Grader's initials", value=st.session_state.grader_name)
+        
+        # Documents come from the catalog (see catalog.py), which is only
+        # re-listed when the docs folder changes
+        docs_folder = config.DOCS_DIR
+        if os.path.exists(docs_folder):
+            with instrumentation.section("catalog_refresh"):
+                catalog.refresh_if_stale(docs_folder)
+
+        if config.ASSIGNMENT_MODE == "queue":
+            assigned_document_picker(docs_folder)
+        else:
+            search_col, hide_col = st.columns([3, 2], vertical_alignment="bottom")
+            with search_col:
+                doc_query = st.text_input("Search documents", key="doc_query", placeholder="Name or part of it")
+            with hide_col:
+                hide_graded = st.checkbox(
+                    "Hide documents I've graded",
+                    key="hide_graded",
+                    value=True,
+                    disabled=not st.session_state.grader_name.strip(),
+                )
+            graded = set()
+            if hide_graded and st.session_state.grader_name.strip():
+                graded = results_store.get_backend().graded_documents(st.session_state.grader_name)
+
+            page_size = config.CATALOG_PAGE_SIZE
+            _, total_docs = catalog.search(doc_query, page=0, page_size=1, exclude_stems=graded)
+            n_doc_pages = max(1, -(-total_docs // page_size))
+            doc_page = 1
+            if n_doc_pages > 1:
+                doc_page = st.number_input(f"Page (of {n_doc_pages})", min_value=1, max_value=n_doc_pages, step=1, key="doc_page")
+            page_docs, _ = catalog.search(doc_query, page=min(doc_page, n_doc_pages) - 1, page_size=page_size, exclude_stems=graded)
+            docs_by_path = {d["path"]: d for d in page_docs}
+
+            def describe_doc(path):
+                d = docs_by_path[path]
+                details = [d["file_type"].upper()]
+                if d["page_count"]:
+                    details.append(f"{d['page_count']} pages")
+                details.append(f"{d['size'] / 1024:,.0f} KB")
+                return f"{path} ({', '.join(details)})"
+
+            if page_docs:
                 # Only show file selector - no manual entry option
                 selected_doc = st.selectbox(
                     "Select document",
-                    options=available_docs,
+                    options=list(docs_by_path),
+                    format_func=describe_doc,
                     index=None,
                     placeholder="Choose a document..."
                 )
+                st.caption(f"{total_docs} matching document(s)")
                 if selected_doc:
                     # Remove file extension for document name
-                    st.session_state.document_name = os.path.splitext(selected_doc)[0]
+                    st.session_state.document_name = docs_by_path[selected_doc]["stem"]
                     st.session_state.selected_doc_path = os.path.join(docs_folder, selected_doc)
                 else:
                     st.session_state.document_name = ""
                     st.session_state.selected_doc_path = ""
+            elif doc_query or graded:
+                st.info("No documents match. Clear the search or show graded documents.")
+                st.session_state.document_name = ""
+                st.session_state.selected_doc_path = ""
             else:
                 st.error(f"❌ No documents found in '{docs_folder}' folder. Please add documents to proceed.")
                 st.session_state.document_name = ""
                 st.session_state.selected_doc_path = ""
-            
-            st.session_state.tag = st.text_input("Tag (optional)", value=st.session_state.tag)
-            
-            start_disabled = not (
-                st.session_state.grader_name.strip() and 
-                st.session_state.document_name.strip()
+        
+        # Warm the chosen document's bytes, page count and text while the grader finishes setting up
+        if st.session_state.selected_doc_path:
+            prefetch.prefetch(st.session_state.selected_doc_path)
+
+        st.session_state.tag = st.text_input("Tag (optional)", value=st.session_state.tag)
+        
+        start_disabled = not (
+            st.session_state.grader_name.strip() and 
+            st.session_state.document_name.strip()
+        )
+        
+        # Offer to pick up where an interrupted session left off
+        unfinished = None
+        if not start_disabled:
+            unfinished = autosave.replay(st.session_state.grader_name, st.session_state.document_name)
+        if unfinished:
+            st.warning(
+                f"You have an unfinished evaluation of this document from {unfinished['date'][:16].replace('T', ' ')} UTC "
+                f"({unfinished['answers']} saved answer(s)). Starting again will discard it."
             )
-            
-            if st.button("Start grading", disabled=start_disabled, type="primary"):
-                # Initialize responses based on current protocol
-                protocol = load_protocol_2point()
-                st.session_state.responses = {
-                    row.Metric: {
-                        "rating": None,
-                        "evidence": "",
-                        "notes": ""
-                    }
-                    for _, row in protocol.iterrows()
-                }
-                st.session_state.index = 0
-                st.session_state.started = True
+            if st.button("Resume evaluation", type="primary"):
+                resume_session(unfinished)
                 st.rerun()
-        else:
-            # Automatically initialize 5-point grading without showing setup screen
-            protocol = load_protocol_5point()
-            st.session_state.responses = {
-                row.Metric: {
-                    "rating": None,
-                    "evidence": "",
-                    "notes": ""
-                }
-                for _, row in protocol.iterrows()
-            }
+
+        if st.button("Start grading", disabled=start_disabled, type="primary" if not unfinished else "secondary"):
+            # Start extracting text now so evidence can be checked right away
+            if textindex.indexable(st.session_state.selected_doc_path):
+                try:
+                    textindex.get_index(st.session_state.selected_doc_path)
+                except textindex.ExtractionFailed:
+                    pass  # the form says so when evidence is entered
+            if config.ASSIGNMENT_MODE == "queue":
+                assignments.renew(st.session_state.grader_name, st.session_state.document_name)
+            autosave.start(
+                st.session_state.grader_name,
+                st.session_state.document_name,
+                st.session_state.selected_doc_path,
+                st.session_state.tag,
+            )
+            # Initialize responses for the first stage
+            st.session_state.stage = 0
+            st.session_state.results = {}
+            st.session_state.responses = empty_responses(current_protocol())
             st.session_state.index = 0
+            st.session_state.prefetched_next = False
             st.session_state.started = True
             st.rerun()
     
+    instrumentation.finish_run(st.session_state)
     st.stop()
 
 
@@ -204,47 +417,49 @@ if st.session_state.show_final_screen:
     
     # st.markdown("---")
     
-    # Create merged output with both 2-point and 5-point results
-    output = {
-        "metadata": {
-            "date": datetime.utcnow().isoformat(),
-            "protocols": ["GradingProtocol-2point.xlsx", "GradingProtocol-5point.xlsx"],
-            "grader_name": st.session_state.grader_name,
-            "document_name": st.session_state.document_name,
-            "tag": st.session_state.tag or None,
-        },
-        "results": {
-            "2-point": st.session_state.results_2point,
-            "5-point": st.session_state.responses
+    # Save once per evaluation: later reruns of this screen (e.g. the
+    # download button) must not store it again
+    if st.session_state.saved_evaluation is None:
+        # Create merged output with the results of every stage
+        pipeline = load_pipeline()
+        output = {
+            "metadata": {
+                "evaluation_id": results_store.new_evaluation_id(),
+                "date": datetime.utcnow().isoformat(),
+                "protocols": pipeline.spreadsheets,
+                "grader_name": st.session_state.grader_name,
+                "document_name": st.session_state.document_name,
+                "tag": st.session_state.tag or None,
+            },
+            "results": {
+                **st.session_state.results,
+                pipeline[-1].name: st.session_state.responses,
+            }
         }
-    }
-    
-
-    
-
+        with instrumentation.section("results_save"):
+            location = results_store.get_backend().save(output)
+        st.session_state.saved_evaluation = {"output": output, "location": location}
+        autosave.finalize(st.session_state.grader_name, st.session_state.document_name, output["metadata"]["evaluation_id"])
+        if config.ASSIGNMENT_MODE == "queue":
+            assignments.complete(
+                st.session_state.grader_name,
+                st.session_state.document_name,
+                os.path.relpath(st.session_state.selected_doc_path, config.DOCS_DIR),
+            )
 
-    # Save to file
-    os.makedirs("outputs", exist_ok=True)
-    safe = lambda s: ("".join(ch if ch.isalnum() else "_" for ch in s.strip())) or "unnamed"
-    timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-    filename_parts = []
-    if st.session_state.tag.strip():
-        filename_parts.append(safe(st.session_state.tag))
-    filename_parts.extend([safe(st.session_state.grader_name), safe(st.session_state.document_name), timestamp])
-    filename = f"outputs/{'_'.join(filename_parts)}.json"
-    
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(output, f, indent=2)
-    
+    output = st.session_state.saved_evaluation["output"]
+    location = st.session_state.saved_evaluation["location"]
 
     col1, col2 = st.columns([1,3])
     with col1:
         st.markdown("### ✅ Grading Complete!")
-        st.info(f"📁 Evaluation log saved to: `{filename}`")
+        st.info(f"📁 Evaluation saved to: `{location}`")
+        with instrumentation.section("json_dump"):
+            download = json.dumps(output, indent=2)
         st.download_button(
             "⬇️ Download Evaluation Log",
-            data=json.dumps(output, indent=2),
-            file_name=os.path.basename(filename),
+            data=download,
+            file_name=results_store.output_filename(output["metadata"]),
             mime="application/json",
             type="primary",
             use_container_width=True
@@ -254,16 +469,18 @@ if st.session_state.show_final_screen:
             for k in [k for k in list(st.session_state.keys()) if k.startswith(("evidence_", "notes_", "rating_"))]:
                 del st.session_state[k]
             st.session_state.responses = {}
-            st.session_state.results_2point = {}
+            st.session_state.results = {}
             st.session_state.grader_name = ""
             st.session_state.document_name = ""
             st.session_state.selected_doc_path = ""
             st.session_state.tag = ""
-            st.session_state.protocol_type = "2-point"
-            st.session_state.completed_2point = False
+            st.session_state.stage = 0
             st.session_state.index = 0
             st.session_state.started = False
             st.session_state.show_final_screen = False
+            st.session_state.saved_evaluation = None
+            st.session_state.viewer_highlights = []
+            st.session_state.pop("viewer_jump", None)
             st.rerun()
 
         # if st.button("👁️ Review Responses", use_container_width=True):
@@ -295,17 +512,28 @@ if st.session_state.show_final_screen:
 
 
     
+    instrumentation.finish_run(st.session_state)
     st.stop()
 
-# Create two-column layout for grading interface
-col_grading, col_document = st.columns([1, 1])
-
-with col_grading:
-    # Load the selected protocol
-    protocol = load_protocol_5point() if st.session_state.protocol_type == "5-point" else load_protocol_2point()
-
-    row = protocol.iloc[st.session_state.index]
-    metric = row.Metric
+# The grading form and the document viewer are separate fragments: editing a
+# rating, evidence or notes reruns only the form, and the viewer is only
+# re-invoked on a full rerun (e.g. when the selected document or the evidence
+# highlights change, see update_highlights).
+@st.fragment
+@instrumentation.fragment("grading_form", st.session_state)
+def grading_form():
+    form_started = time.perf_counter()
+    # Load the current stage's protocol
+    pipeline = load_pipeline()
+    protocol = pipeline[st.session_state.stage]
+
+    row = protocol[st.session_state.index]
+    metric = row.name
+
+    # Close to the end of the last stage: get the next document ready
+    if (st.session_state.stage == len(pipeline) - 1
+            and st.session_state.index >= len(protocol) - 1 - config.PREFETCH_METRICS_AHEAD):
+        prefetch_next_document()
 
     # Ensure metric exists in responses (defensive initialization)
     if metric not in st.session_state.responses:
@@ -332,52 +560,25 @@ with col_grading:
         #   <div class="metric-title">Metric {st.session_state.index + 1} of {len(protocol)}:</div>
     with st.container(border=True):
         # st.markdown(f":yellow-badge[What are you evaluating]: The document on the right-hand side")
-        st.markdown(f":yellow-badge[You need to evaluate if the document on the right satisfies the following:] {row['Metric Defination']}")
-
-    # Display rating guidance based on protocol type
-    if st.session_state.protocol_type == "5-point":
-        rating_columns = [
-            "Rating 5 (max positive)",
-            "Rating 4",
-            "Rating 3",
-            "Rating 2",
-            "Rating 1",
-            "Rating 0 (N/A or absent)"
-        ]
-        rating_values = [5, 4, 3, 2, 1, 0]
-    else:  # 2-point
-        # Dynamically determine rating columns from the protocol
-        available_cols = [col for col in protocol.columns if col.startswith("Rating")]
-        if not available_cols:
-            st.error("No rating columns found in 2-point protocol")
-            st.stop()
-        
-        # Sort by rating value (extract number from column name)
-        rating_columns = sorted(available_cols, key=lambda x: int(''.join(filter(str.isdigit, x.split()[1]))), reverse=True)
-        rating_values = [int(''.join(filter(str.isdigit, col.split()[1]))) for col in rating_columns]
+        st.markdown(f":yellow-badge[You need to evaluate if the document on the right satisfies the following:] {row.definition}")
 
-    guidance_data = {
-        "Rating": rating_columns,
-        "What it means": [str(row[col]) if pd.notna(row[col]) else "" for col in rating_columns]
-    }
-    guidance_df = pd.DataFrame(guidance_data)
-    st.dataframe(guidance_df, use_container_width=True, hide_index=True)
+    # Rating columns and values are parsed when the protocol is compiled
+    if not row.ratings:
+        st.error(f"No rating columns found in {protocol.name} protocol")
+        st.stop()
+    # The guidance table and rating labels are built when the pipeline is loaded
+    with instrumentation.section("guidance_table"):
+        st.dataframe(row.guidance, use_container_width=True, hide_index=True)
 
     # Rating selector
-    rating_labels = []
-    for val, col in zip(rating_values, rating_columns):
-        desc = str(row[col]) if pd.notna(row[col]) else ""
-        label = f"{val} - {desc[:50]}..." if len(desc) > 50 else f"{val} - {desc}"
-        rating_labels.append(label)
-
     stored_rating = st.session_state.responses[metric]["rating"]
-    rating_index = rating_values.index(stored_rating) if stored_rating in rating_values else None
+    rating_index = row.values.index(stored_rating) if stored_rating in row.labels else None
 
     ratingText=(f"After reading the document on the right, select your rating for :blue-badge[{metric}] (see criteria above):") 
     rating = st.selectbox(
         ratingText,
-        options=rating_values,
-        format_func=lambda x: rating_labels[rating_values.index(x)],
+        options=row.values,
+        format_func=row.labels.__getitem__,
         index=rating_index,
         placeholder="Choose a rating...",
         # label_visibility="collapsed",
@@ -396,6 +597,29 @@ with col_grading:
         value=st.session_state.responses[metric]["evidence"],
         height=120
     )
+    # Check the evidence against the document text (see textindex.py)
+    verification, status = check_evidence(st.session_state.get(f"evidence_{metric}", ""))
+    if status == "pending":
+        st.caption("⏳ Indexing the document text to check your evidence…")
+    elif status == "failed":
+        st.session_state.responses[metric]["verification"] = None
+        st.caption(":orange[⚠ The document's text could not be extracted, so evidence can't be checked]")
+    elif status == "unsupported":
+        st.session_state.responses[metric]["verification"] = None
+        st.caption("Evidence is checked against the document text for PDFs only")
+    else:
+        st.session_state.responses[metric]["verification"] = verification
+        if verification is None:
+            pass
+        elif verification["score"] >= 1:
+            st.caption(f":green[✓ Evidence found verbatim on page {verification['page']}]")
+        elif verification["found"]:
+            st.caption(f":green[✓ Evidence closely matches page {verification['page']} ({verification['score']:.0%} match)]")
+        elif verification["page"]:
+            st.caption(f":orange[⚠ Evidence not found verbatim; the closest passage, on page {verification['page']}, is a {verification['score']:.0%} match]")
+        else:
+            st.caption(":red[✗ Evidence not found in the document]")
+        update_highlights(st.session_state.get(f"evidence_{metric}", ""))
     # ratingText=(f"Select rating for :blue-badge[{metric}]:") 
     st.session_state.responses[metric]["notes"] = st.session_state.get(f"notes_{metric}", "")
 
@@ -414,8 +638,8 @@ with col_grading:
     with col2:
         st.button("Next ➡", on_click=next_metric, disabled=next_disabled)
     with col3:
-        # Show "Create Final Evaluation Log" button only on last metric of 5-point protocol
-        if st.session_state.protocol_type == "5-point" and st.session_state.index == len(protocol) - 1:
+        # Show "Create Final Evaluation Log" button only on the last metric of the last stage
+        if st.session_state.stage == len(pipeline) - 1 and st.session_state.index == len(protocol) - 1:
             if st.button("Create Final Evaluation Log", disabled=next_disabled, type="primary"):
                 st.session_state.show_final_screen = True
                 st.rerun()
@@ -449,22 +673,27 @@ with col_grading:
             col_confirm, col_cancel = st.columns(2)
             with col_confirm:
                 if st.button("✅ Yes, restart", type="primary", use_container_width=True, key="confirm_restart_btn"):
+                    autosave.discard(st.session_state.grader_name, st.session_state.document_name)
+                    if config.ASSIGNMENT_MODE == "queue":
+                        assignments.release(st.session_state.grader_name, st.session_state.document_name)
                     # clear widget states for metric-bound inputs
                     for k in [k for k in list(st.session_state.keys()) if k.startswith(("evidence_", "notes_", "rating_"))]:
                         del st.session_state[k]
                     # reset responses to pristine state
                     st.session_state.responses = {}
-                    st.session_state.results_2point = {}
+                    st.session_state.results = {}
                     # reset metadata and navigation
                     st.session_state.grader_name = ""
                     st.session_state.document_name = ""
                     st.session_state.selected_doc_path = ""
                     st.session_state.tag = ""
-                    st.session_state.protocol_type = "2-point"
-                    st.session_state.completed_2point = False
+                    st.session_state.stage = 0
                     st.session_state.index = 0
                     st.session_state.started = False
                     st.session_state.show_final_screen = False
+                    st.session_state.saved_evaluation = None
+                    st.session_state.viewer_highlights = []
+                    st.session_state.pop("viewer_jump", None)
                     st.session_state.confirm_restart = False
                     st.rerun()
             with col_cancel:
@@ -472,31 +701,151 @@ with col_grading:
                     st.session_state.confirm_restart = False
                     st.rerun()
 
-# Document viewer column
-with col_document:
+    # Server-side cost of this form rerun (see FORM_LATENCY_TARGET_MS)
+    st.session_state.form_rerun_ms = (time.perf_counter() - form_started) * 1000
+
+
+def shift_viewer_page(page_key, delta, n_pages):
+    st.session_state[page_key] = max(1, min(st.session_state[page_key] + delta, n_pages))
+
+
+def page_window_navigator(doc_path):
+    """Render the page navigator for long PDFs and return the pdf_viewer window args.
+
+    Only PDF_PAGE_WINDOW pages around the current page are rendered; the
+    rest are rendered on demand as the grader moves through the document.
+    """
+    # Page requested by the grading form, e.g. where the evidence was found
+    jump = st.session_state.pop("viewer_jump", None)
+    window = config.PDF_PAGE_WINDOW
+    if not window:
+        return {}
+    n_pages = documents.page_count(doc_path)
+    if n_pages is None:
+        # pypdf can't parse it; let the viewer show what it can, unwindowed
+        return {}
+    if n_pages <= window:
+        return {}
+
+    page_key = f"viewer_page_{doc_path}"
+    if page_key not in st.session_state:
+        st.session_state[page_key] = 1
+    if jump:
+        st.session_state[page_key] = min(jump, n_pages)
+
+    nav_prev, nav_page, nav_next = st.columns([1, 2, 1], vertical_alignment="bottom")
+    with nav_prev:
+        st.button("◀ Previous pages", on_click=shift_viewer_page, args=(page_key, -window, n_pages),
+                  disabled=st.session_state[page_key] <= 1, use_container_width=True)
+    with nav_page:
+        page = st.number_input(f"Jump to page (of {n_pages})", min_value=1, max_value=n_pages, step=1, key=page_key)
+    with nav_next:
+        st.button("Next pages ▶", on_click=shift_viewer_page, args=(page_key, window, n_pages),
+                  disabled=st.session_state[page_key] >= n_pages, use_container_width=True)
+
+    start = max(1, min(page - window // 2, n_pages - window + 1))
+    end = start + window - 1
+    st.caption(f"Showing pages {start}–{end} of {n_pages}")
+    return {"pages_to_render": list(range(start, end + 1)), "scroll_to_page": page}
+
+
+def text_viewer(doc_path, height):
+    """Paged view of a plain-text document with search across the whole file."""
+    if not textview.is_text(doc_path):
+        st.caption("Preview is only available for PDF and plain-text files.")
+        return
+    with instrumentation.section("text_index"):
+        n_pages = textview.page_count(doc_path)
+    page_key = f"viewer_page_{doc_path}"
+    if page_key not in st.session_state:
+        st.session_state[page_key] = 1
+
+    query = st.text_input("Search in document", key=f"viewer_search_{doc_path}", placeholder="Text to find")
+    if query.strip():
+        with instrumentation.section("text_search"):
+            hits = textview.search(doc_path, query.strip())
+        if hits:
+            hit_pages = [p for p, _ in hits]
+            matches = dict(hits)
+            choice = st.selectbox(
+                f"Found on {len(hits)} page(s)",
+                options=hit_pages,
+                format_func=lambda p: f"Page {p} ({matches[p]} match{'es' if matches[p] > 1 else ''})",
+                key=f"viewer_hit_{doc_path}_{query.strip()}",
+            )
+            if st.session_state.get(f"viewer_hit_shown_{doc_path}") != (query.strip(), choice):
+                st.session_state[f"viewer_hit_shown_{doc_path}"] = (query.strip(), choice)
+                st.session_state[page_key] = choice
+        else:
+            st.caption("No matches.")
+
+    if n_pages > 1:
+        nav_prev, nav_page, nav_next = st.columns([1, 2, 1], vertical_alignment="bottom")
+        with nav_prev:
+            st.button("◀ Previous page", on_click=shift_viewer_page, args=(page_key, -1, n_pages),
+                      disabled=st.session_state[page_key] <= 1, use_container_width=True)
+        with nav_page:
+            st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, step=1, key=page_key)
+        with nav_next:
+            st.button("Next page ▶", on_click=shift_viewer_page, args=(page_key, 1, n_pages),
+                      disabled=st.session_state[page_key] >= n_pages, use_container_width=True)
+
+    content = textview.read_page(doc_path, st.session_state[page_key])
+    if doc_path.lower().endswith((".md", ".markdown")):
+        with st.container(height=height, border=False):
+            st.markdown(content)
+    else:
+        st.text_area("Document content", content, height=height, disabled=True, label_visibility="collapsed")
+
+
+@st.fragment
+@instrumentation.fragment("document_viewer", st.session_state)
+def document_viewer():
     # st.subheader("📄 Document Viewer")
     viewer_height = 900
     if st.session_state.selected_doc_path and os.path.exists(st.session_state.selected_doc_path):
         if st.session_state.selected_doc_path.lower().endswith('.pdf'):
             with st.container(border=True):
-                with open(st.session_state.selected_doc_path, "rb") as pdf_file:
-                    binary_data = pdf_file.read()
-                pdf_viewer(
-                    input=binary_data,
-                    width=610,
-                    height=viewer_height,
-                    render_text=True,
-                    viewer_align="left",
-                )
+                # Shared across sessions; only touches disk when the file changes
+                with instrumentation.section("pdf_read"):
+                    binary_data = doc_cache.read(st.session_state.selected_doc_path)
+                window_args = page_window_navigator(st.session_state.selected_doc_path)
+                # Evidence highlights for the current metric (see update_highlights)
+                annotations = st.session_state.viewer_highlights
+                if "pages_to_render" in window_args:
+                    annotations = [a for a in annotations if a["page"] in window_args["pages_to_render"]]
+                if annotations:
+                    window_args.pop("scroll_to_page", None)
+                    window_args["scroll_to_annotation"] = 1
+                with instrumentation.section("pdf_viewer"):
+                    pdf_viewer(
+                        input=binary_data,
+                        width=610,
+                        height=viewer_height,
+                        render_text=True,
+                        viewer_align="left",
+                        annotations=annotations,
+                        **window_args,
+                    )
         else:
             st.info(f"📎 Selected document: {st.session_state.document_name}")
-            st.caption("PDF preview is only available for PDF files.")
-            # Try to display text content for non-PDF files
+            # Plain-text documents are shown a page at a time (see textview.py)
             try:
-                with open(st.session_state.selected_doc_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-                    st.text_area("Document content", content, height=wrapper_height, disabled=True)
-            except Exception as e:
+                text_viewer(st.session_state.selected_doc_path, viewer_height)
+            except OSError as e:
                 st.warning(f"Cannot display document content: {e}")
     else:
-        st.info("No document selected or file not found.")
\ No newline at end of file
+        st.info("No document selected or file not found.")
+
+
+# Create two-column layout for grading interface
+col_grading, col_document = st.columns([1, 1])
+
+with col_grading:
+    grading_form()
+
+# Document viewer column
+with col_document:
+    document_viewer()
+
+instrumentation.finish_run(st.session_state)
@@ -0,0 +1,313 @@
+"""Work queue assigning documents to graders.
+
+Each document should end up with GRADERS_PER_DOCUMENT independent graders,
+and each grader with a fair share of the work. A grader claims the next
+document from the catalog that still needs raters; the claim is a lease
+that is renewed whenever the grader saves progress, and that lapses when a
+session is abandoned so the document goes back into the queue.
+
+Claims run inside one ``BEGIN IMMEDIATE`` transaction, so concurrent
+sessions are serialized by SQLite and the (document, grader) primary key
+guarantees nobody gets the same document twice.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+
+import catalog
+import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assignments (
+    document TEXT NOT NULL COLLATE NOCASE,
+    grader TEXT NOT NULL COLLATE NOCASE,
+    path TEXT,
+    status TEXT NOT NULL,
+    claimed_at REAL NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (document, grader)
+);
+CREATE INDEX IF NOT EXISTS assignments_grader ON assignments(grader, status);
+CREATE INDEX IF NOT EXISTS assignments_expiry ON assignments(expires_at) WHERE status = 'leased';
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Statuses that count towards a document's graders (and a grader's share);
+# "skipped" only keeps the document away from that grader
+COUNTED = ("leased", "done")
+
+# Databases whose schema this process has already created
+_initialized = set()
+_init_lock = threading.Lock()
+
+
+def connect(db_path=None):
+    db_path = db_path or config.ASSIGNMENTS_DB
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    # isolation_level=None: transactions are opened explicitly with BEGIN IMMEDIATE
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    path = os.path.abspath(db_path)
+    if path not in _initialized:
+        # Both persist in the database file, so once per process is enough
+        with _init_lock:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            _initialized.add(path)
+    return conn
+
+
+def _lease(row):
+    document, path, claimed_at, expires_at = row
+    return {"document": document, "path": path, "claimed_at": claimed_at, "expires_at": expires_at}
+
+
+def current(grader, db_path=None):
+    """The grader's unexpired lease, or None."""
+    conn = connect(db_path)
+    try:
+        row = conn.execute(
+            "SELECT document, path, claimed_at, expires_at FROM assignments "
+            "WHERE grader = ? AND status = 'leased' AND expires_at >= ? ORDER BY claimed_at LIMIT 1",
+            (grader.strip(), time.time()),
+        ).fetchone()
+    finally:
+        conn.close()
+    return _lease(row) if row else None
+
+
+def claim(grader, exclude_stems=(), k=None, db_path=None, catalog_db=None, expected_graders=None):
+    """Lease the next document for a grader; returns the lease or None.
+
+    The grader's existing lease is returned (and renewed) if there is one.
+    Otherwise the grader gets a catalog document that has fewer than k
+    graders and that they have not claimed, skipped or (per exclude_stems)
+    already evaluated. Documents closest to k graders come first, so pairs
+    of ratings are completed before new documents are opened. None means
+    nothing is left for this grader, or they already hold their fair share
+    (k × documents ÷ expected_graders, by default EXPECTED_GRADERS; no cap
+    when that is 0).
+
+    The share is not based on the graders seen so far: the first graders to
+    claim would otherwise be entitled to everything before the others arrive.
+    """
+    grader = grader.strip()
+    k = k or config.GRADERS_PER_DOCUMENT
+    if expected_graders is None:
+        expected_graders = config.EXPECTED_GRADERS
+    now = time.time()
+    expires_at = now + config.ASSIGNMENT_LEASE_SECONDS
+    conn = connect(db_path)
+    try:
+        conn.execute("ATTACH DATABASE ? AS cat", (catalog_db or config.CATALOG_DB,))
+        conn.execute("CREATE TEMP TABLE excluded (stem TEXT PRIMARY KEY COLLATE NOCASE)")
+        conn.executemany("INSERT OR IGNORE INTO temp.excluded VALUES (?)", [(s,) for s in exclude_stems])
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM assignments WHERE status = 'leased' AND expires_at < ?", (now,))
+            row = conn.execute(
+                "SELECT document, path, claimed_at FROM assignments WHERE grader = ? AND status = 'leased' "
+                "ORDER BY claimed_at LIMIT 1",
+                (grader,),
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE assignments SET expires_at = ? WHERE document = ? AND grader = ?",
+                    (expires_at, row[0], grader),
+                )
+                conn.execute("COMMIT")
+                return _lease(row + (expires_at,))
+
+            if expected_graders > 0:
+                n_documents = conn.execute(
+                    "SELECT COUNT(DISTINCT stem COLLATE NOCASE) FROM cat.documents"
+                ).fetchone()[0]
+                taken = conn.execute(
+                    "SELECT COUNT(*) FROM assignments WHERE grader = ? AND status IN (?, ?)", (grader,) + COUNTED
+                ).fetchone()[0]
+                if taken >= math.ceil(n_documents * k / expected_graders):
+                    conn.execute("COMMIT")
+                    return None
+
+            row = _next_document(conn, grader, k)
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "INSERT INTO assignments (document, grader, path, status, claimed_at, expires_at) "
+                "VALUES (?, ?, ?, 'leased', ?, ?)",
+                (row[0], grader, row[1], now, expires_at),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return _lease((row[0], row[1], now, expires_at))
+
+
+def _next_document(conn, grader, k, random_order=True):
+    # Needs the catalog attached as "cat" and a temp.excluded table
+    return conn.execute(
+        f"""
+        SELECT d.stem, d.path FROM (
+            SELECT stem COLLATE NOCASE AS stem, MIN(path) AS path FROM cat.documents GROUP BY 1
+        ) d
+        LEFT JOIN (
+            SELECT document, COUNT(*) AS n FROM assignments
+            WHERE status = 'done' OR (status = 'leased' AND expires_at >= ?) GROUP BY document
+        ) c ON c.document = d.stem
+        WHERE COALESCE(c.n, 0) < ?
+          AND NOT EXISTS (SELECT 1 FROM assignments a WHERE a.document = d.stem AND a.grader = ?)
+          AND NOT EXISTS (SELECT 1 FROM temp.excluded e WHERE e.stem = d.stem)
+        ORDER BY COALESCE(c.n, 0) DESC, {"random()" if random_order else "d.stem"}
+        LIMIT 1
+        """,
+        (time.time(), k, grader),
+    ).fetchone()
+
+
+def peek(grader, exclude_stems=(), k=None, db_path=None, catalog_db=None):
+    """The document a claim would most likely hand this grader next, without leasing it.
+
+    Returns {"document", "path"} or None. Ties are broken by name instead of
+    at random, so repeated peeks agree with each other.
+    """
+    conn = connect(db_path)
+    try:
+        conn.execute("ATTACH DATABASE ? AS cat", (catalog_db or config.CATALOG_DB,))
+        conn.execute("CREATE TEMP TABLE excluded (stem TEXT PRIMARY KEY COLLATE NOCASE)")
+        conn.executemany("INSERT OR IGNORE INTO temp.excluded VALUES (?)", [(s,) for s in exclude_stems])
+        row = _next_document(conn, grader.strip(), k or config.GRADERS_PER_DOCUMENT, random_order=False)
+    finally:
+        conn.close()
+    return {"document": row[0], "path": row[1]} if row else None
+
+
+def _write(sql, params, db_path=None):
+    conn = connect(db_path)
+    try:
+        return conn.execute(sql, params).rowcount
+    finally:
+        conn.close()
+
+
+def renew(grader, document, db_path=None):
+    """Extend a lease after the grader saved progress; False if it is gone."""
+    return _write(
+        "UPDATE assignments SET expires_at = ? WHERE document = ? AND grader = ? AND status = 'leased'",
+        (time.time() + config.ASSIGNMENT_LEASE_SECONDS, document, grader.strip()),
+        db_path,
+    ) > 0
+
+
+def complete(grader, document, path=None, db_path=None):
+    """Record a finished evaluation (leased or not) towards the document's graders."""
+    _write(
+        "INSERT INTO assignments (document, grader, path, status, claimed_at, expires_at) "
+        "VALUES (?, ?, ?, 'done', ?, NULL) "
+        "ON CONFLICT (document, grader) DO UPDATE SET status = 'done', expires_at = NULL, "
+        "path = COALESCE(excluded.path, path)",
+        (document, grader.strip(), path, time.time()),
+        db_path,
+    )
+
+
+def release(grader, document, db_path=None):
+    """Give a leased document back to the queue, e.g. when an evaluation is restarted."""
+    _write(
+        "DELETE FROM assignments WHERE document = ? AND grader = ? AND status = 'leased'",
+        (document, grader.strip()),
+        db_path,
+    )
+
+
+def skip(grader, document, db_path=None):
+    """Give a leased document back and never offer it to this grader again."""
+    _write(
+        "UPDATE assignments SET status = 'skipped', expires_at = NULL "
+        "WHERE document = ? AND grader = ? AND status = 'leased'",
+        (document, grader.strip()),
+        db_path,
+    )
+
+
+def seed(pairs, db_path=None):
+    """Count already stored evaluations, given as (document, grader) pairs; returns rows added."""
+    now = time.time()
+    conn = connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO assignments (document, grader, status, claimed_at) VALUES (?, ?, 'done', ?)",
+            [(document, grader.strip(), now) for document, grader in pairs],
+        )
+        added = conn.total_changes - before
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('seeded_at', ?)", (str(now),))
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    return added
+
+
+def ensure_seeded(db_path=None):
+    """Seed the queue from the results store the first time it is used."""
+    conn = connect(db_path)
+    try:
+        seeded = conn.execute("SELECT 1 FROM meta WHERE key = 'seeded_at'").fetchone()
+    finally:
+        conn.close()
+    if not seeded:
+        import results_store
+
+        seed(results_store.get_backend().graded_pairs(), db_path)
+
+
+def coverage(db_path=None, catalog_db=None):
+    """{graders: documents} over the catalog, counting live leases and finished evaluations."""
+    conn = connect(db_path)
+    try:
+        conn.execute("ATTACH DATABASE ? AS cat", (catalog_db or config.CATALOG_DB,))
+        rows = conn.execute(
+            """
+            SELECT COALESCE(c.n, 0) AS graders, COUNT(*) FROM (
+                SELECT DISTINCT stem COLLATE NOCASE AS stem FROM cat.documents
+            ) d
+            LEFT JOIN (
+                SELECT document, COUNT(*) AS n FROM assignments
+                WHERE status = 'done' OR (status = 'leased' AND expires_at >= ?) GROUP BY document
+            ) c ON c.document = d.stem
+            GROUP BY 1 ORDER BY 1
+            """,
+            (time.time(),),
+        ).fetchall()
+    finally:
+        conn.close()
+    return dict(rows)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or seed the document assignment queue.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("seed", help="Count evaluations already in the results store")
+    sub.add_parser("status", help="Show how many documents have 0, 1, ... graders")
+    args = parser.parse_args()
+
+    if args.command == "seed":
+        import results_store
+
+        print(f"Added {seed(results_store.get_backend().graded_pairs())} finished evaluation(s)")
+    else:
+        catalog.refresh()
+        for graders, documents in coverage().items():
+            print(f"{graders} grader(s): {documents} document(s)")
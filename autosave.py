@@ -0,0 +1,128 @@
+"""Crash-safe progress logs for grading sessions.
+
+Each (grader, document) pair gets a JSON-lines file in SESSIONS_DIR. Moving
+between metrics appends one small record with the answer just left and the
+new position, so saving never re-serializes the whole session. Replaying the
+file rebuilds the session in one pass; a half-written last line (crash mid
+append) is ignored. Finalizing compacts the log to a single "final" record.
+"""
+import json
+import os
+from datetime import datetime
+
+import config
+
+
+def _safe(s):
+    return ("".join(ch if ch.isalnum() else "_" for ch in (s or "").strip())) or "unnamed"
+
+
+def log_path(grader, document):
+    return os.path.join(config.SESSIONS_DIR, f"{_safe(grader)}__{_safe(document)}.jsonl")
+
+
+def _append(path, record):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+
+def start(grader, document, doc_path, tag=""):
+    """Begin a fresh log for (grader, document), discarding any previous one."""
+    os.makedirs(config.SESSIONS_DIR, exist_ok=True)
+    path = log_path(grader, document)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({
+            "type": "start",
+            "grader": grader,
+            "document": document,
+            "doc_path": doc_path,
+            "tag": tag,
+            "date": datetime.utcnow().isoformat(),
+        }, ensure_ascii=False) + "\n")
+    return path
+
+
+def record(grader, document, protocol, metric, answer, next_protocol, next_index):
+    """Append the answer for one metric plus the position the grader moved to."""
+    path = log_path(grader, document)
+    if not os.path.exists(path):
+        return
+    _append(path, {
+        "type": "answer",
+        "protocol": protocol,
+        "metric": metric,
+        "rating": answer.get("rating"),
+        "evidence": answer.get("evidence", ""),
+        "notes": answer.get("notes", ""),
+        "verification": answer.get("verification"),
+        "position": [next_protocol, next_index],
+    })
+
+
+def replay(grader, document):
+    """Rebuild an unfinished session from its log, or return None."""
+    path = log_path(grader, document)
+    try:
+        f = open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return None
+
+    session = None
+    with f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                # Truncated final line from an interrupted append
+                break
+            kind = rec.get("type")
+            if kind == "start":
+                session = {
+                    "grader": rec["grader"],
+                    "document": rec["document"],
+                    "doc_path": rec.get("doc_path", ""),
+                    "tag": rec.get("tag", ""),
+                    "date": rec.get("date"),
+                    "results": {},
+                    "protocol": None,
+                    "index": 0,
+                    "answers": 0,
+                }
+            elif kind == "answer" and session is not None:
+                session["results"].setdefault(rec["protocol"], {})[rec["metric"]] = {
+                    "rating": rec.get("rating"),
+                    "evidence": rec.get("evidence", ""),
+                    "notes": rec.get("notes", ""),
+                    "verification": rec.get("verification"),
+                }
+                session["protocol"], session["index"] = rec["position"]
+                session["answers"] += 1
+            elif kind == "final":
+                return None
+    if session is None or session["answers"] == 0:
+        return None
+    return session
+
+
+def finalize(grader, document, evaluation_id):
+    """Compact a finished session's log to a single marker record."""
+    path = log_path(grader, document)
+    if not os.path.exists(path):
+        return
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(json.dumps({
+            "type": "final",
+            "grader": grader,
+            "document": document,
+            "evaluation_id": evaluation_id,
+            "date": datetime.utcnow().isoformat(),
+        }, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+
+
+def discard(grader, document):
+    try:
+        os.remove(log_path(grader, document))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,309 @@
+"""Headless benchmarks for the grading app's rerun and save paths.
+
+Drives app.py through Streamlit's AppTest against synthetic protocols
+(10/100/1000 metrics) and synthetic PDFs (1/100/1000 pages). Every
+(metrics, pages) scenario runs in its own process so peak RSS is
+attributable to it; timings are per interaction, repeated --repeat times.
+
+    python benchmarks/bench_app.py                       # all scenarios
+    python benchmarks/bench_app.py --metrics 10 --pages 300
+    python benchmarks/bench_app.py --compare benchmarks/results/OLD.json
+
+Results are written as JSON (by default benchmarks/results/<commit>.json)
+so runs can be compared across commits. AppTest reruns the whole script
+for every interaction, so form timings are an upper bound on what a
+fragment-only rerun costs in the browser. The form's own server-side time
+(st.session_state.form_rerun_ms) is recorded as "form_rerun"; a scenario
+whose median exceeds FORM_LATENCY_TARGET_MS is reported as FAIL and the run
+exits non-zero.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LINES_PER_PAGE = 40
+WORDS = ("policy generative artificial intelligence students staff assessment integrity "
+         "guidance disclosure teaching learning university school module coursework").split()
+
+
+def write_protocols(data_dir, n_metrics, n_stages=2):
+    """Both synthetic spreadsheets plus a pipeline of n_stages stages.
+
+    All but the last stage use the 2-point spreadsheet; the last uses the
+    5-point one.
+    """
+    import pandas as pd
+
+    metrics = [f"Metric {i + 1}" for i in range(n_metrics)]
+    two = pd.DataFrame({
+        "Metric": metrics,
+        "Metric Defination": [f"The material addresses requirement {i + 1}." for i in range(n_metrics)],
+        "Rating 1: Agree": "Requirement is met",
+        "Rating 0: Disagree": "Requirement is not met",
+    })
+    five = pd.DataFrame({"Metric": metrics, "Metric Defination": two["Metric Defination"]})
+    for col in ["Rating 5 (max positive)", "Rating 4", "Rating 3", "Rating 2", "Rating 1", "Rating 0 (N/A or absent)"]:
+        five[col] = f"{col} description for this metric, long enough to be truncated in the selector"
+    os.makedirs(data_dir, exist_ok=True)
+    two.to_excel(os.path.join(data_dir, "GradingProtocol-2point.xlsx"), index=False)
+    five.to_excel(os.path.join(data_dir, "GradingProtocol-5point.xlsx"), index=False)
+    stages = [{"name": f"screening-{i + 1}", "spreadsheet": "GradingProtocol-2point.xlsx"} for i in range(n_stages - 1)]
+    stages.append({"name": "5-point", "spreadsheet": "GradingProtocol-5point.xlsx"})
+    with open(os.path.join(data_dir, "protocols.json"), "w", encoding="utf-8") as f:
+        json.dump({"stages": stages}, f, indent=2)
+
+
+def page_line(page, line):
+    words = [WORDS[(page * 7 + line * 3 + k) % len(WORDS)] for k in range(10)]
+    return f"{page + 1}.{line + 1} " + " ".join(words)
+
+
+def write_pdf(path, n_pages):
+    """Minimal text PDF (Helvetica, LINES_PER_PAGE lines per page)."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for p in range(n_pages):
+        lines = [f"({page_line(p, i)}) Tj 0 -16 Td" for i in range(LINES_PER_PAGE)]
+        stream = ("BT /F1 11 Tf 72 760 Td " + " ".join(lines) + " ET").encode()
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> "
+            b"/Contents %d 0 R >>" % content_id
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), n_pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (i, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def _summary(samples):
+    ordered = sorted(samples)
+    return {
+        "runs": len(samples),
+        "median_ms": round(statistics.median(samples), 2),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))], 2),
+        "min_ms": round(ordered[0], 2),
+    }
+
+
+def _timed(action):
+    started = time.perf_counter()
+    action()
+    return (time.perf_counter() - started) * 1000
+
+
+def run_scenario(n_metrics, n_pages, n_stages, repeat, workdir):
+    """Runs inside the child process; returns the scenario's result dict."""
+    from streamlit.testing.v1 import AppTest
+
+    def widget(kind, prefix):
+        return [w for w in getattr(at, kind) if w.key and w.key.startswith(prefix)][0]
+
+    def button(label):
+        return [b for b in at.button if b.label.startswith(label)][0]
+
+    def answer(value, evidence):
+        widget("selectbox", "rating_").set_value(value).run()
+        widget("text_area", "evidence_").input(evidence).run()
+
+    def fresh_session():
+        app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=600)
+        app.run()
+        app.text_input[0].input("BENCH").run()
+        # Earlier repetitions graded the document already
+        app.checkbox(key="hide_graded").uncheck().run()
+        app.selectbox[0].select("synthetic.pdf").run()
+        return app
+
+    timings = {name: [] for name in ("cold_start", "start", "rating_change", "highlight_change", "evidence_edit",
+                                     "next", "next_stage", "final_save", "form_rerun")}
+    evidence = page_line(0, 3)
+
+    timings["cold_start"].append(_timed(lambda: AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=600).run()))
+    # Evidence is only checked and highlighted once the text index is ready
+    import textindex
+
+    textindex.get_index(os.path.join(os.environ["MARKSHEET_DOCS_DIR"], "synthetic.pdf"), wait=True)
+    for r in range(repeat):
+        at = fresh_session()
+        timings["start"].append(_timed(lambda: button("Start").click().run()))
+        timings["rating_change"].append(_timed(lambda: widget("selectbox", "rating_").set_value(r % 2).run()))
+        timings["form_rerun"].append(at.session_state["form_rerun_ms"])
+        # Evidence found in the document: new highlights, so the whole page (and viewer) reruns
+        timings["highlight_change"].append(_timed(lambda: widget("text_area", "evidence_").input(evidence).run()))
+        # Same passage, so the same highlights: only the form reruns
+        timings["evidence_edit"].append(_timed(lambda: widget("text_area", "evidence_").input(f"{evidence} ").run()))
+        timings["form_rerun"].append(at.session_state["form_rerun_ms"])
+        at.run()
+        timings["next"].append(_timed(lambda: button("Next").click().run()))
+        timings["form_rerun"].append(at.session_state["form_rerun_ms"])
+
+        # Jump to the last metric of each stage and cross into the next one
+        for _ in range(n_stages - 1):
+            at.session_state["index"] = n_metrics - 1
+            at.run()
+            answer(1, evidence)
+            at.run()
+            timings["next_stage"].append(_timed(lambda: button("Next").click().run()))
+
+        # Jump to the last metric of the last (5-point) stage and save the evaluation
+        at.session_state["index"] = n_metrics - 1
+        at.run()
+        answer(3, evidence)
+        at.run()
+        timings["final_save"].append(_timed(lambda: button("Create Final Evaluation Log").click().run()))
+        if at.exception:
+            raise RuntimeError([e.value for e in at.exception])
+
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+    return {
+        "metrics": n_metrics,
+        "stages": n_stages,
+        "pages": n_pages,
+        "interactions": {name: _summary(samples) for name, samples in timings.items() if samples},
+        "peak_rss_mb": round(peak_rss_mb, 1),
+    }
+
+
+def child_main(args):
+    workdir = args.workdir
+    os.environ.update({
+        "MARKSHEET_DATA_DIR": os.path.join(workdir, "data"),
+        "MARKSHEET_DOCS_DIR": os.path.join(workdir, "docs"),
+        "MARKSHEET_CACHE_DIR": os.path.join(workdir, "cache"),
+        "MARKSHEET_RESULTS_DIR": os.path.join(workdir, "outputs"),
+        "MARKSHEET_RESULTS_DB": os.path.join(workdir, "outputs", "evaluations.db"),
+        "MARKSHEET_SESSIONS_DIR": os.path.join(workdir, "sessions"),
+        "MARKSHEET_CATALOG_DB": os.path.join(workdir, "cache", "catalog.db"),
+        "MARKSHEET_ASSIGNMENTS_DB": os.path.join(workdir, "outputs", "assignments.db"),
+        # Pick the synthetic document directly; every repetition grades it again
+        "MARKSHEET_ASSIGNMENT_MODE": "free",
+    })
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    write_protocols(os.environ["MARKSHEET_DATA_DIR"], args.child[0], args.stages)
+    os.makedirs(os.environ["MARKSHEET_DOCS_DIR"], exist_ok=True)
+    write_pdf(os.path.join(os.environ["MARKSHEET_DOCS_DIR"], "synthetic.pdf"), args.child[1])
+    result = run_scenario(args.child[0], args.child[1], args.stages, args.repeat, workdir)
+    print(json.dumps(result))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current, previous_path):
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = json.load(f)
+    before = {(s["metrics"], s["pages"]): s for s in previous["scenarios"]}
+    print(f"\nCompared with {previous.get('commit', '?')[:10]}:")
+    for s in current["scenarios"]:
+        old = before.get((s["metrics"], s["pages"]))
+        if not old:
+            continue
+        for name, stats in s["interactions"].items():
+            if name in old["interactions"]:
+                was = old["interactions"][name]["median_ms"]
+                change = (stats["median_ms"] - was) / was * 100 if was else 0.0
+                print(f"  {s['metrics']:>5} metrics {s['pages']:>5} pages  {name:<15} "
+                      f"{was:>9.1f} -> {stats['median_ms']:>9.1f} ms ({change:+.0f}%)")
+
+
+def check_target(current):
+    """Print a line per scenario whose median form rerun exceeds the target; True if none do."""
+    target = current["form_latency_target_ms"]
+    ok = True
+    for s in current["scenarios"]:
+        stats = s["interactions"].get("form_rerun")
+        if stats and stats["median_ms"] > target:
+            ok = False
+            print(f"FAIL {s['metrics']:>5} metrics {s['pages']:>5} pages: form rerun median "
+                  f"{stats['median_ms']:.1f} ms exceeds the {target:.0f} ms target")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark app.py interactions headlessly.")
+    parser.add_argument("--metrics", type=int, nargs="+", default=[10, 100, 1000], help="Metrics per protocol")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 100, 1000], help="Pages in the synthetic PDF")
+    parser.add_argument("--stages", type=int, default=2, help="Stages in the protocol pipeline")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions of each interaction")
+    parser.add_argument("--output", help="JSON results file (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare medians with")
+    parser.add_argument("--child", type=int, nargs=2, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child_main(args)
+        return
+
+    import streamlit
+
+    sys.path.insert(0, ROOT)
+    from config import FORM_LATENCY_TARGET_MS
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "streamlit": streamlit.__version__,
+        "platform": platform.platform(),
+        "form_latency_target_ms": FORM_LATENCY_TARGET_MS,
+        "scenarios": [],
+    }
+    for n_metrics in args.metrics:
+        for n_pages in args.pages:
+            with tempfile.TemporaryDirectory(prefix="marksheet-bench-") as workdir:
+                proc = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", str(n_metrics), str(n_pages),
+                     "--stages", str(args.stages), "--repeat", str(args.repeat), "--workdir", workdir],
+                    capture_output=True, text=True,
+                )
+            if proc.returncode != 0:
+                print(proc.stderr, file=sys.stderr)
+                raise SystemExit(f"Scenario {n_metrics} metrics / {n_pages} pages failed")
+            scenario = json.loads(proc.stdout.strip().splitlines()[-1])
+            results["scenarios"].append(scenario)
+            timings = ", ".join(f"{k} {v['median_ms']:.0f}" for k, v in scenario["interactions"].items())
+            print(f"{n_metrics:>5} metrics {n_pages:>5} pages: {timings} ms; peak RSS {scenario['peak_rss_mb']} MB")
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"{commit[:10]}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {output}")
+    if args.compare:
+        compare(results, args.compare)
+    if not check_target(results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""Indexed catalog of the documents available for grading.
+
+Listing a large (possibly network-mounted) docs folder on every setup rerun
+is slow, so the catalog keeps one SQLite row per document with its size,
+mtime, file type, content hash and page count. refresh() only re-lists
+directories whose mtime changed since the last pass; hashes and page counts
+are filled in afterwards by fill_metadata(), which the app runs in a
+background thread.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    name TEXT NOT NULL,
+    stem TEXT NOT NULL,
+    file_type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT,
+    page_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS documents_directory ON documents(directory);
+CREATE INDEX IF NOT EXISTS documents_name ON documents(name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS documents_pending ON documents(sha256) WHERE sha256 IS NULL;
+
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+
+COLUMNS = ("path", "name", "stem", "file_type", "size", "mtime_ns", "sha256", "page_count")
+
+
+def connect(db_path=None):
+    db_path = db_path or config.CATALOG_DB
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _file_row(rel_path, stat):
+    name = os.path.basename(rel_path)
+    stem, ext = os.path.splitext(name)
+    return (rel_path, os.path.dirname(rel_path), name, stem, ext.lstrip(".").lower() or "file",
+            stat.st_size, stat.st_mtime_ns)
+
+
+def refresh(docs_dir=None, db_path=None, full=False):
+    """Bring the catalog in line with the docs folder; returns rows changed.
+
+    Only directories whose mtime changed are re-listed (that is when files
+    are added, removed or renamed). full=True also re-stats every file to
+    catch in-place edits.
+    """
+    docs_dir = docs_dir or config.DOCS_DIR
+    changed = 0
+    conn = connect(db_path)
+    try:
+        known_dirs = dict(conn.execute("SELECT path, mtime_ns FROM directories"))
+        seen_dirs = set()
+        pending = [""]
+        with conn:
+            while pending:
+                rel_dir = pending.pop()
+                abs_dir = os.path.join(docs_dir, rel_dir)
+                try:
+                    mtime_ns = os.stat(abs_dir).st_mtime_ns
+                except FileNotFoundError:
+                    continue
+                seen_dirs.add(rel_dir)
+                if not full and known_dirs.get(rel_dir) == mtime_ns:
+                    # Unchanged listing: reuse the known subdirectories
+                    pending.extend(p for (p,) in conn.execute("SELECT path FROM directories WHERE parent = ?", (rel_dir,)))
+                    continue
+
+                files = {}
+                with os.scandir(abs_dir) as it:
+                    for entry in it:
+                        if entry.name.startswith((".", "~$")):
+                            continue
+                        rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                        if entry.is_dir():
+                            pending.append(rel_path)
+                        elif entry.is_file():
+                            files[rel_path] = entry.stat()
+
+                stored = {
+                    path: (size, mtime)
+                    for path, size, mtime in conn.execute(
+                        "SELECT path, size, mtime_ns FROM documents WHERE directory = ?", (rel_dir,))
+                }
+                removed = [(p,) for p in stored if p not in files]
+                conn.executemany("DELETE FROM documents WHERE path = ?", removed)
+                upserts = [
+                    _file_row(path, stat)
+                    for path, stat in files.items()
+                    if stored.get(path) != (stat.st_size, stat.st_mtime_ns)
+                ]
+                # A changed file loses its hash and page count until fill_metadata runs again
+                conn.executemany(
+                    "INSERT INTO documents (path, directory, name, stem, file_type, size, mtime_ns) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, "
+                    "sha256 = NULL, page_count = NULL",
+                    upserts,
+                )
+                parent = os.path.dirname(rel_dir) if rel_dir else None
+                conn.execute(
+                    "INSERT OR REPLACE INTO directories (path, parent, mtime_ns) VALUES (?, ?, ?)",
+                    (rel_dir, parent, mtime_ns),
+                )
+                changed += len(removed) + len(upserts)
+
+            gone = [(p,) for p in known_dirs if p not in seen_dirs]
+            if gone:
+                conn.executemany("DELETE FROM directories WHERE path = ?", gone)
+                conn.executemany("DELETE FROM documents WHERE directory = ?", gone)
+                changed += len(gone)
+    finally:
+        conn.close()
+    return changed
+
+
+def _describe(abs_path, file_type):
+    h = hashlib.sha256()
+    with open(abs_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    page_count = None
+    if file_type == "pdf":
+        try:
+            from pypdf import PdfReader
+
+            page_count = len(PdfReader(abs_path).pages)
+        except Exception:
+            page_count = None
+    return h.hexdigest(), page_count
+
+
+def fill_metadata(docs_dir=None, db_path=None, limit=None):
+    """Compute the content hash and page count of documents that lack them."""
+    docs_dir = docs_dir or config.DOCS_DIR
+    conn = connect(db_path)
+    done = 0
+    try:
+        query = "SELECT path, file_type, size, mtime_ns FROM documents WHERE sha256 IS NULL"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        for path, file_type, size, mtime_ns in conn.execute(query).fetchall():
+            try:
+                sha256, page_count = _describe(os.path.join(docs_dir, path), file_type)
+            except OSError:
+                continue
+            with conn:
+                # Skip the update if the file changed while we were reading it
+                conn.execute(
+                    "UPDATE documents SET sha256 = ?, page_count = ? WHERE path = ? AND size = ? AND mtime_ns = ?",
+                    (sha256, page_count, path, size, mtime_ns),
+                )
+            done += 1
+    finally:
+        conn.close()
+    return done
+
+
+def _like_escape(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search(query="", page=0, page_size=None, exclude_stems=(), db_path=None):
+    """Return (rows, total) for documents whose name matches query.
+
+    Names starting with the query sort before names that merely contain it.
+    exclude_stems drops documents by name without extension, which is how
+    evaluations refer to documents.
+    """
+    page_size = page_size or config.CATALOG_PAGE_SIZE
+    query = (query or "").strip()
+    conn = connect(db_path)
+    try:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS excluded (stem TEXT PRIMARY KEY COLLATE NOCASE)")
+        conn.executemany("INSERT OR IGNORE INTO temp.excluded VALUES (?)", [(s,) for s in exclude_stems])
+        where = ("path LIKE ? ESCAPE '\\' "
+                 "AND NOT EXISTS (SELECT 1 FROM temp.excluded e WHERE e.stem = documents.stem)")
+        pattern = f"%{_like_escape(query)}%"
+        total = conn.execute(f"SELECT COUNT(*) FROM documents WHERE {where}", (pattern,)).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM documents WHERE {where} "
+            "ORDER BY name NOT LIKE ? ESCAPE '\\', name COLLATE NOCASE, path "
+            "LIMIT ? OFFSET ?",
+            (pattern, f"{_like_escape(query)}%", page_size, page * page_size),
+        ).fetchall()
+    finally:
+        conn.close()
+    return [dict(zip(COLUMNS, row)) for row in rows], total
+
+
+def get(path, db_path=None):
+    conn = connect(db_path)
+    try:
+        row = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM documents WHERE path = ?", (path,)).fetchone()
+    finally:
+        conn.close()
+    return dict(zip(COLUMNS, row)) if row else None
+
+
+_refresh_lock = threading.Lock()
+_last_refresh = 0.0
+# Held by the background fill_metadata thread, so only one runs per process
+_fill_lock = threading.Lock()
+
+
+def _fill_in_background(docs_dir, db_path):
+    try:
+        fill_metadata(docs_dir, db_path)
+    finally:
+        _fill_lock.release()
+
+
+def refresh_if_stale(docs_dir=None, db_path=None):
+    """Refresh at most every CATALOG_REFRESH_SECONDS per process, filling
+    hashes and page counts in a background thread (unless one is still
+    running from an earlier refresh)."""
+    global _last_refresh
+    if time.monotonic() - _last_refresh < config.CATALOG_REFRESH_SECONDS:
+        return
+    if not _refresh_lock.acquire(blocking=False):
+        return
+    try:
+        refresh(docs_dir, db_path)
+        _last_refresh = time.monotonic()
+    finally:
+        _refresh_lock.release()
+    if _fill_lock.acquire(blocking=False):
+        threading.Thread(target=_fill_in_background, args=(docs_dir, db_path), daemon=True).start()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rebuild the document catalog.")
+    parser.add_argument("--full", action="store_true", help="Re-stat every file, not just changed directories")
+    args = parser.parse_args()
+    print(f"{refresh(full=args.full)} change(s); {fill_metadata()} document(s) hashed")
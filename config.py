@@ -0,0 +1,79 @@
+"""Deployment settings shared by the grading app and its helper modules.
+
+Every value can be overridden with a MARKSHEET_* environment variable so
+several deployments (or benchmarks) can point the same code at different
+folders without editing it.
+"""
+import os
+
+# Folder holding the GradingProtocol-*.xlsx spreadsheets
+DATA_DIR = os.environ.get("MARKSHEET_DATA_DIR", "data")
+
+# Folder for derived artifacts (compiled protocols, caches); safe to delete
+CACHE_DIR = os.environ.get("MARKSHEET_CACHE_DIR", ".cache")
+
+# Upper bound for the in-process document byte cache (shared by all sessions)
+DOC_CACHE_BYTES = int(os.environ.get("MARKSHEET_DOC_CACHE_BYTES", 512 * 1024 * 1024))
+
+# Target server-side time for one grading-form interaction (rating, evidence,
+# notes, Back/Next) with a 300-page PDF open; checked by benchmarks/bench_app.py
+FORM_LATENCY_TARGET_MS = float(os.environ.get("MARKSHEET_FORM_LATENCY_TARGET_MS", 100))
+
+# Pages rendered at once by the PDF viewer; 0 renders the whole document
+PDF_PAGE_WINDOW = int(os.environ.get("MARKSHEET_PDF_PAGE_WINDOW", 20))
+
+# Where finished evaluations are stored: "sqlite" or "json" (one file per evaluation)
+RESULTS_BACKEND = os.environ.get("MARKSHEET_RESULTS_BACKEND", "sqlite")
+RESULTS_DIR = os.environ.get("MARKSHEET_RESULTS_DIR", "outputs")
+RESULTS_DB = os.environ.get("MARKSHEET_RESULTS_DB", os.path.join(RESULTS_DIR, "evaluations.db"))
+
+# Append-only progress logs used to resume unfinished grading sessions
+SESSIONS_DIR = os.environ.get("MARKSHEET_SESSIONS_DIR", "sessions")
+
+# Documents offered for grading, and the catalog that indexes them
+DOCS_DIR = os.environ.get("MARKSHEET_DOCS_DIR", "docs")
+CATALOG_DB = os.environ.get("MARKSHEET_CATALOG_DB", os.path.join(CACHE_DIR, "catalog.db"))
+CATALOG_REFRESH_SECONDS = float(os.environ.get("MARKSHEET_CATALOG_REFRESH_SECONDS", 30))
+CATALOG_PAGE_SIZE = int(os.environ.get("MARKSHEET_CATALOG_PAGE_SIZE", 50))
+
+# Evidence verification: a fuzzy match at or above this score counts as found
+EVIDENCE_MATCH_THRESHOLD = float(os.environ.get("MARKSHEET_EVIDENCE_MATCH_THRESHOLD", 0.8))
+TEXT_INDEX_WORKERS = int(os.environ.get("MARKSHEET_TEXT_INDEX_WORKERS", 2))
+
+# Opt-in profiling of script runs (see instrumentation.py)
+PROFILE = os.environ.get("MARKSHEET_PROFILE", "").lower() in ("1", "true", "yes", "on")
+PROFILE_LOG = os.environ.get("MARKSHEET_PROFILE_LOG", os.path.join(CACHE_DIR, "profile", "runs.jsonl"))
+PROFILE_LOG_BYTES = int(os.environ.get("MARKSHEET_PROFILE_LOG_BYTES", 10 * 1024 * 1024))
+PROFILE_LOG_BACKUPS = int(os.environ.get("MARKSHEET_PROFILE_LOG_BACKUPS", 5))
+
+# Document assignment: "free" lets graders pick any document from the catalog;
+# "queue" hands each grader the next document that still needs raters
+ASSIGNMENT_MODE = os.environ.get("MARKSHEET_ASSIGNMENT_MODE", "free")
+ASSIGNMENTS_DB = os.environ.get("MARKSHEET_ASSIGNMENTS_DB", os.path.join(RESULTS_DIR, "assignments.db"))
+GRADERS_PER_DOCUMENT = int(os.environ.get("MARKSHEET_GRADERS_PER_DOCUMENT", 2))
+# Graders expected to take part in queue mode; each gets at most
+# graders per document x documents / this many. 0: no cap, graders take one
+# document at a time for as long as work is left
+EXPECTED_GRADERS = int(os.environ.get("MARKSHEET_EXPECTED_GRADERS", 0))
+# An assignment is released when its grader saves no progress for this long
+ASSIGNMENT_LEASE_SECONDS = float(os.environ.get("MARKSHEET_ASSIGNMENT_LEASE_SECONDS", 60 * 60))
+
+# Ordered grading stages, each naming a protocol spreadsheet in DATA_DIR
+PIPELINE = os.environ.get("MARKSHEET_PIPELINE", os.path.join(DATA_DIR, "protocols.json"))
+
+# Paging of plain-text documents in the viewer (see textview.py)
+TEXT_PAGE_LINES = int(os.environ.get("MARKSHEET_TEXT_PAGE_LINES", 200))
+TEXT_PAGE_BYTES = int(os.environ.get("MARKSHEET_TEXT_PAGE_BYTES", 64 * 1024))
+
+# Background preparation of the next document (see prefetch.py): worker
+# threads, and how many metrics before the end of the last stage to start
+PREFETCH_WORKERS = int(os.environ.get("MARKSHEET_PREFETCH_WORKERS", 1))
+PREFETCH_METRICS_AHEAD = int(os.environ.get("MARKSHEET_PREFETCH_METRICS_AHEAD", 3))
+
+# On-disk cache shared by every server process on the machine (see
+# shared_cache.py); least recently used entries go once it outgrows the budget
+SHARED_CACHE_DIR = os.environ.get("MARKSHEET_SHARED_CACHE_DIR", os.path.join(CACHE_DIR, "shared"))
+SHARED_CACHE_BYTES = int(os.environ.get("MARKSHEET_SHARED_CACHE_BYTES", 2 * 1024 * 1024 * 1024))
+
+# Folder written by export.py (partitioned Parquet); replaced on every export
+EXPORT_DIR = os.environ.get("MARKSHEET_EXPORT_DIR", os.path.join(RESULTS_DIR, "parquet"))
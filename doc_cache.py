@@ -0,0 +1,127 @@
+"""Process-wide cache of document bytes.
+
+Every Streamlit session in a server process shares one ``bytes`` object per
+document, so graders looking at the same PDF don't each hold a copy and a
+rerun doesn't go back to disk. Entries are keyed by path + mtime + size, so
+an edited file is picked up on the next access, and the least recently used
+documents are evicted once the byte budget is exceeded.
+
+The bytes themselves are not copied into the shared on-disk cache (the file
+already is one); their content hash is, so other server processes can key
+derived data without hashing the document again.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import config
+import shared_cache
+
+
+class DocumentCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (path, mtime_ns, size) -> bytes
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        self._loading = {}  # key -> Lock, so concurrent misses read the file once
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key_for(path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        return (path, stat.st_mtime_ns, stat.st_size)
+
+    def get(self, path):
+        key = self.key_for(path)
+        with self._lock:
+            data = self._lookup(key)
+            if data is not None:
+                self.hits += 1
+                return data
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        with loading:
+            try:
+                # Another session may have finished reading while we waited
+                with self._lock:
+                    data = self._lookup(key)
+                    if data is not None:
+                        self.hits += 1
+                        return data
+                    self.misses += 1
+                with open(key[0], "rb") as f:
+                    data = f.read()
+                with self._lock:
+                    self._store(key, data)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+        return data
+
+    def _lookup(self, key):
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+        return data
+
+    def _store(self, key, data):
+        # Drop older versions of the same file
+        for old in [k for k in self._entries if k[0] == key[0] and k != key]:
+            self._current_bytes -= len(self._entries.pop(old))
+        if len(data) > self.max_bytes:
+            # Too big to keep; serve it uncached
+            return
+        self._entries[key] = data
+        self._current_bytes += len(data)
+        while self._current_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._current_bytes -= len(evicted)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+
+
+# Module-level singleton: imported modules outlive script reruns, so this is
+# shared by every session in the server process.
+_cache = DocumentCache(config.DOC_CACHE_BYTES)
+
+
+def read(path):
+    return _cache.get(path)
+
+
+@lru_cache(maxsize=4096)
+def _digest(key):
+    name = hashlib.sha1(repr(key).encode()).hexdigest()
+    return shared_cache.get_or_build(
+        "digests", name, lambda: hashlib.sha256(read(key[0])).hexdigest().encode()
+    ).decode()
+
+
+def digest(path):
+    """SHA-256 of a document's contents, computed once per file version across processes."""
+    return _digest(DocumentCache.key_for(path))
+
+
+def stats():
+    return _cache.stats()
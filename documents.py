@@ -0,0 +1,29 @@
+"""Metadata derived from document files (page counts etc.)."""
+import io
+from functools import lru_cache
+
+import doc_cache
+import shared_cache
+
+
+@lru_cache(maxsize=1024)
+def _pdf_page_count(key):
+    def count():
+        from pypdf import PdfReader
+        from pypdf.errors import PyPdfError
+
+        try:
+            return {"pages": len(PdfReader(io.BytesIO(doc_cache.read(key[0]))).pages)}
+        except (PyPdfError, ValueError):
+            # Corrupt or encrypted: remembered like a count, so it is not parsed again
+            return {"pages": None}
+
+    return shared_cache.json_value("pages", doc_cache.digest(key[0]), count)["pages"]
+
+
+def page_count(path):
+    """Number of pages in a PDF, memoized per (path, mtime, size) and shared by content hash.
+
+    None if pypdf cannot read the file.
+    """
+    return _pdf_page_count(doc_cache.DocumentCache.key_for(path))
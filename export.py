@@ -0,0 +1,427 @@
+"""Bulk export of every stored evaluation to partitioned Parquet.
+
+Reads the JSON logs in outputs/ (old flat ``results`` and nested
+``results["2-point"/"5-point"]`` layouts, see results_store.iter_answers)
+and the SQLite results database, and writes one typed table with a row per
+answer, partitioned by protocol and document (hive layout, e.g.
+``protocol=5-point/document=policy1/``). String columns are
+dictionary-encoded, each file with a dictionary of just its own values, so
+readers get categoricals back. Evaluations imported
+into the database from outputs/ keep their evaluation_id and are exported
+once.
+
+Parsing runs on a process pool, in chunks of files or of database rows.
+The quality checks then run on the combined table; most of them work on the
+dictionaries of distinct values rather than on every row:
+
+* ``placeholder_evidence``: evidence that is not a quote, such as "sdsd"
+* ``duplicated_evidence``: the same evidence given for several metrics of
+  one evaluation
+* ``missing_rating``: an answer without a rating
+* ``metric_issue``: the metric name does not match the current spreadsheet
+  for its protocol ("whitespace" for names like "Copyright and Data
+  Privacy " that only differ in stray spaces, "unknown metric", or
+  "unknown protocol"); ``metric_name`` holds the cleaned-up name
+
+    python export.py                          # outputs/parquet, with a quality summary
+    python export.py --out /data/marks --flagged flagged.csv
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from urllib.parse import quote
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import config
+import protocols
+import results_store
+
+# Evidence with fewer distinct letters and digits than this is a placeholder
+PLACEHOLDER_DISTINCT_CHARS = 6
+
+# Bit per ASCII letter or digit, for counting distinct characters with
+# bitwise ORs (other bytes get no bit)
+_ALNUM_BITS = np.zeros(256, dtype=np.uint64)
+for _bit, _byte in enumerate(b"0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"):
+    _ALNUM_BITS[_byte] = np.uint64(1) << np.uint64(_bit)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# Work per pool task
+CHUNK_FILES = 2000
+CHUNK_EVALUATIONS = 5000
+# Distinct evidence values checked for placeholders at a time (bounds memory)
+CHUNK_PLACEHOLDERS = 50000
+
+STRING = pa.dictionary(pa.int32(), pa.string())
+SCHEMA = pa.schema([
+    ("evaluation_id", STRING),
+    ("source", STRING),
+    ("created_at", pa.timestamp("us")),
+    ("grader", STRING),
+    ("document", STRING),
+    ("tag", STRING),
+    ("protocol", STRING),
+    ("metric", STRING),
+    ("rating", pa.int8()),
+    ("evidence", STRING),
+    ("notes", STRING),
+    ("evidence_found", pa.bool_()),
+    ("evidence_page", pa.int32()),
+    ("evidence_score", pa.float32()),
+])
+FLAGS = ("placeholder_evidence", "duplicated_evidence", "missing_rating", "metric_issue")
+
+
+def _timestamp(value):
+    try:
+        return datetime.fromisoformat(value).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        return None
+
+
+def _table(columns):
+    arrays = []
+    for field in SCHEMA:
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(columns[field.name], type=pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(columns[field.name], type=field.type))
+    return pa.Table.from_arrays(arrays, schema=SCHEMA)
+
+
+def _empty_columns():
+    return {f.name: [] for f in SCHEMA}
+
+
+def _json_chunk(paths):
+    """Rows of a chunk of JSON evaluation logs."""
+    columns = _empty_columns()
+    ids = set()
+    for path in paths:
+        source = os.path.basename(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                output = json.load(f)
+        except (OSError, ValueError):
+            continue
+        metadata = output.get("metadata") or {}
+        evaluation_id = metadata.get("evaluation_id") or uuid.uuid5(results_store.IMPORT_NAMESPACE, source).hex
+        if evaluation_id in ids:
+            continue
+        ids.add(evaluation_id)
+        head = (evaluation_id, source, _timestamp(metadata.get("date")),
+                metadata.get("grader_name") or "Unknown", metadata.get("document_name") or "Unknown",
+                metadata.get("tag"))
+        for protocol, metric, answer in results_store.iter_answers(output):
+            answer = answer if isinstance(answer, dict) else {}
+            rating = answer.get("rating")
+            verification = answer.get("verification") or {}
+            row = head + (protocol, metric, rating if isinstance(rating, int) else None,
+                          answer.get("evidence"), answer.get("notes"),
+                          bool(verification["found"]) if "found" in verification else None,
+                          verification.get("page"), verification.get("score"))
+            for name, value in zip(columns, row):
+                columns[name].append(value)
+    return _table(columns)
+
+
+def _db_chunk(db_path, lo, hi):
+    """Rows of the evaluations with lo <= rowid < hi in the results database."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT r.evaluation_id, COALESCE(e.source, ?), e.created_at, r.grader, r.document, e.tag, "
+            "r.protocol, r.metric, r.rating, r.evidence, r.notes, r.evidence_found, r.evidence_page, r.evidence_score "
+            "FROM evaluations e JOIN ratings r USING (evaluation_id) WHERE e.rowid >= ? AND e.rowid < ?",
+            (os.path.basename(db_path), lo, hi),
+        ).fetchall()
+    finally:
+        conn.close()
+    columns = dict(zip((f.name for f in SCHEMA), map(list, zip(*rows)))) if rows else _empty_columns()
+    columns["created_at"] = [_timestamp(v) for v in columns["created_at"]]
+    columns["evidence_found"] = [None if v is None else bool(v) for v in columns["evidence_found"]]
+    return _table(columns)
+
+
+def _run(task):
+    kind, *args = task
+    return _json_chunk(*args) if kind == "json" else _db_chunk(*args)
+
+
+def _tasks(outputs_dir, db_path):
+    paths = sorted(glob.glob(os.path.join(outputs_dir, "*.json"))) if outputs_dir else []
+    tasks = [("json", paths[i:i + CHUNK_FILES]) for i in range(0, len(paths), CHUNK_FILES)]
+    if db_path and os.path.exists(db_path):
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            lo, hi = conn.execute("SELECT MIN(rowid), MAX(rowid) FROM evaluations").fetchone()
+        finally:
+            conn.close()
+        if lo is not None:
+            tasks += [("db", db_path, i, i + CHUNK_EVALUATIONS) for i in range(lo, hi + 1, CHUNK_EVALUATIONS)]
+    return tasks
+
+
+def read_all(outputs_dir=None, db_path=None, workers=None):
+    """Every stored answer as one Arrow table (SCHEMA), JSON logs first."""
+    tasks = _tasks(outputs_dir, db_path)
+    if not tasks:
+        return SCHEMA.empty_table()
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers == 1:
+        parts = [_run(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_run, tasks))
+
+    # Keep the first copy of an evaluation: JSON logs come before the
+    # database, and a log may have been copied under another name
+    kept = []
+    seen = pa.array([], pa.string())
+    for part in parts:
+        ids = part["evaluation_id"].cast(pa.string())
+        if len(seen):
+            part = part.filter(pc.invert(pc.is_in(ids, value_set=seen)))
+            ids = part["evaluation_id"].cast(pa.string())
+        seen = pa.concat_arrays([seen, pc.unique(ids)]) if part.num_rows else seen
+        kept.append(part)
+    return pa.concat_tables(kept).unify_dictionaries().combine_chunks()
+
+
+def _codes(column):
+    """(indices as int64 with -1 for nulls, dictionary) of a dictionary column."""
+    array = column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+    return pc.fill_null(array.indices, -1).to_numpy().astype(np.int64), array.dictionary
+
+
+def _string_buffers(strings):
+    """(offsets rebased to 0, UTF-8 bytes) of a string array."""
+    strings = strings.cast(pa.large_string())
+    offsets = np.frombuffer(strings.buffers()[1], np.int64)[strings.offset:strings.offset + len(strings) + 1]
+    data = np.frombuffer(strings.buffers()[2], np.uint8)[offsets[0]:offsets[-1]]
+    return offsets - offsets[0], data
+
+
+def _other_alnum_chars(offsets, data):
+    """Number of distinct non-ASCII letters and digits in each string.
+
+    Every multibyte character becomes one integer key (its UTF-8 bytes,
+    packed) tagged with its string; whether a character is a letter or digit
+    is decided once per distinct character.
+    """
+    starts = np.flatnonzero(data >= 0xC0)  # first byte of each multibyte character
+    counts = np.zeros(len(offsets) - 1, dtype=np.int64)
+    if not len(starts):
+        return counts
+    padded = np.concatenate([data, np.zeros(3, np.uint8)]).astype(np.uint32)
+    lead = padded[starts]
+    width = np.where(lead < 0xE0, 2, np.where(lead < 0xF0, 3, 4)).astype(np.uint32)
+    key = (lead << 24) | (padded[starts + 1] << 16) | (padded[starts + 2] << 8) | padded[starts + 3]
+    key >>= (4 - width) * 8
+    chars, char_of = np.unique(key, return_inverse=True)
+    alnum = np.array([
+        int(c).to_bytes(4, "big").lstrip(b"\0").decode("utf-8", errors="replace").isalnum() for c in chars
+    ], dtype=bool)
+    keep = alnum[char_of]
+    row = np.searchsorted(offsets, starts[keep], side="right") - 1
+    distinct = np.unique((row.astype(np.int64) << 32) | key[keep])
+    counts += np.bincount(distinct >> 32, minlength=len(counts))
+    return counts
+
+
+def _placeholders(normalized):
+    """Whether each evidence value has fewer than PLACEHOLDER_DISTINCT_CHARS distinct letters and digits.
+
+    ASCII letters and digits are counted with one bitmask per value; the
+    (rare) other characters are counted separately.
+    """
+    few = np.zeros(len(normalized), dtype=bool)
+    for start in range(0, len(normalized), CHUNK_PLACEHOLDERS):
+        chunk = normalized.slice(start, CHUNK_PLACEHOLDERS)
+        offsets, data = _string_buffers(chunk)
+        # OR of each value's bits; reduceat gives empty values the next byte's, so reset them
+        starts = offsets[:-1]
+        masks = np.bitwise_or.reduceat(np.append(_ALNUM_BITS[data], np.uint64(0)), np.minimum(starts, len(data)))
+        masks[offsets[1:] == starts] = 0
+        distinct = _POPCOUNT[masks.view(np.uint8)].reshape(-1, 8).sum(axis=1) + _other_alnum_chars(offsets, data)
+        few[start:start + len(chunk)] = distinct < PLACEHOLDER_DISTINCT_CHARS
+    return few
+
+
+def _current_metrics():
+    """{protocol: set of metric names} from the current pipeline's spreadsheets."""
+    return {
+        stage["name"]: {m["name"] for m in protocols.compiled_artifact(stage["spreadsheet"])["metrics"]}
+        for stage in protocols.pipeline_stages()
+    }
+
+
+def quality_scan(table, current=None):
+    """Add metric_name and the FLAGS columns to an exported table."""
+    current = _current_metrics() if current is None else current
+    n = table.num_rows
+
+    # Evidence: normalize each distinct value once, then map rows through the codes
+    ev_codes, ev_values = _codes(table["evidence"])
+    normalized = pc.binary_join(pc.utf8_split_whitespace(pc.utf8_lower(ev_values)), " ")
+    blank = pc.equal(pc.utf8_length(normalized), 0).to_numpy(zero_copy_only=False)
+    placeholder = _placeholders(normalized) & ~blank
+    canonical = pc.dictionary_encode(normalized).indices.to_numpy().astype(np.int64)
+    has_evidence = ev_codes >= 0
+    row_blank = np.ones(n, dtype=bool)
+    row_blank[has_evidence] = blank[ev_codes[has_evidence]]
+    placeholder_rows = np.zeros(n, dtype=bool)
+    placeholder_rows[has_evidence] = placeholder[ev_codes[has_evidence]]
+
+    # Metric names: checked per distinct (protocol, metric) pair
+    proto_codes, proto_values = _codes(table["protocol"])
+    metric_codes, metric_values = _codes(table["metric"])
+    pair_keys = proto_codes * (len(metric_values) + 1) + metric_codes
+    pairs, pair_of_row = np.unique(pair_keys, return_inverse=True)
+    proto_list, metric_list = proto_values.to_pylist(), metric_values.to_pylist()
+    names, issues = [], []  # per pair
+    for key in pairs:
+        protocol = proto_list[key // (len(metric_values) + 1)]
+        metric = metric_list[key % (len(metric_values) + 1)]
+        name = protocols.normalize_metric(metric)
+        names.append(name)
+        if protocol not in current:
+            issues.append("unknown protocol")
+        elif name not in current[protocol]:
+            issues.append("unknown metric")
+        elif name != metric:
+            issues.append("whitespace")
+        else:
+            issues.append(None)
+    metric_name = pc.dictionary_encode(pa.array(names, pa.string())).take(pa.array(pair_of_row))
+    name_codes = metric_name.indices.to_numpy().astype(np.int64)
+
+    # Duplicated evidence: one evaluation, one normalized text, several metric names
+    eval_codes, _ = _codes(table["evaluation_id"])
+    candidates = np.flatnonzero(~row_blank)
+    duplicated = np.zeros(n, dtype=bool)
+    if len(candidates):
+        text = canonical[ev_codes[candidates]]
+        group = eval_codes[candidates] * (int(canonical.max()) + 1) + text
+        distinct = np.unique(np.stack([group, name_codes[candidates]], axis=1), axis=0)
+        groups, counts = np.unique(distinct[:, 0], return_counts=True)
+        duplicated[candidates] = np.isin(group, groups[counts > 1])
+
+    return table.append_column(
+        "metric_name", metric_name
+    ).append_column(
+        "placeholder_evidence", pa.array(placeholder_rows)
+    ).append_column(
+        "duplicated_evidence", pa.array(duplicated)
+    ).append_column(
+        "missing_rating", pc.is_null(table["rating"])
+    ).append_column(
+        "metric_issue", pa.array(issues, pa.string()).dictionary_encode().take(pa.array(pair_of_row))
+    )
+
+
+def _compact(part):
+    """Re-encode dictionary columns so a partition only carries its own values."""
+    for i, field in enumerate(part.schema):
+        if pa.types.is_dictionary(field.type):
+            part = part.set_column(i, field, pc.dictionary_encode(part.column(i).cast(pa.string())))
+    return part
+
+
+def write(table, out_dir):
+    """Replace out_dir with the table as Parquet, one folder per protocol and document.
+
+    Returns the number of partitions written.
+    """
+    tmp = f"{out_dir.rstrip(os.sep)}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    proto_codes, _ = _codes(table["protocol"])
+    doc_codes, _ = _codes(table["document"])
+    order = np.lexsort((doc_codes, proto_codes))
+    table = table.take(order)
+    keys = proto_codes[order] * (int(doc_codes.max(initial=0)) + 1) + doc_codes[order]
+    bounds = [0, *(np.flatnonzero(np.diff(keys)) + 1), table.num_rows] if table.num_rows else [0]
+    for start, end in zip(bounds, bounds[1:]):
+        part = table.slice(start, end - start)
+        folder = os.path.join(
+            tmp,
+            f"protocol={quote(part['protocol'][0].as_py(), safe='')}",
+            f"document={quote(part['document'][0].as_py(), safe='')}",
+        )
+        os.makedirs(folder, exist_ok=True)
+        pq.write_table(
+            _compact(part.drop_columns(["protocol", "document"])),
+            os.path.join(folder, "part-0.parquet"),
+            compression="zstd",
+            use_dictionary=True,
+        )
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp, out_dir)
+    return len(bounds) - 1
+
+
+def summarize(table):
+    """Flagged rows and evaluations per check."""
+    evaluation_ids = table["evaluation_id"]
+    summary = {}
+    for flag in FLAGS:
+        mask = pc.is_valid(table[flag]) if flag == "metric_issue" else table[flag]
+        flagged = evaluation_ids.filter(mask)
+        summary[flag] = (len(flagged), len(pc.unique(flagged)))
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export all evaluations to partitioned Parquet with quality flags.")
+    parser.add_argument("--outputs", default=config.RESULTS_DIR, help="Folder of JSON evaluation logs")
+    parser.add_argument("--db", default=config.RESULTS_DB, help="SQLite results database to include")
+    parser.add_argument("--no-db", action="store_true", help="Only read JSON logs")
+    parser.add_argument("--out", default=config.EXPORT_DIR, help="Folder to write (replaced)")
+    parser.add_argument("--workers", type=int, default=None, help="Processes for parsing")
+    parser.add_argument("--flagged", help="Also write the rows with any quality flag to this CSV file")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    table = read_all(args.outputs, None if args.no_db else args.db, args.workers)
+    read_s = time.perf_counter() - started
+    table = quality_scan(table)
+    partitions = write(table, args.out)
+    print(f"Exported {table.num_rows:,} answers from {len(pc.unique(table['evaluation_id'])):,} evaluations "
+          f"to {args.out} ({partitions:,} partitions) in {time.perf_counter() - started:.1f}s "
+          f"(reading {read_s:.1f}s)")
+    for flag, (rows, evaluations) in summarize(table).items():
+        print(f"  {flag}: {rows:,} answers in {evaluations:,} evaluations")
+    issues = table.filter(pc.is_valid(table["metric_issue"])).group_by(["protocol", "metric", "metric_issue"]).aggregate(
+        [("evaluation_id", "count")]
+    )
+    for row in issues.to_pylist():
+        print(f"    {row['protocol']} {row['metric']!r}: {row['metric_issue']} ({row['evaluation_id_count']:,})")
+
+    if args.flagged:
+        mask = pc.or_(pc.or_(table["placeholder_evidence"], table["duplicated_evidence"]),
+                      pc.or_(table["missing_rating"], pc.is_valid(table["metric_issue"])))
+        flagged = table.filter(mask).select(
+            ["evaluation_id", "source", "grader", "document", "protocol", "metric", "rating", "evidence"] + list(FLAGS)
+        )
+        import pyarrow.csv
+
+        pyarrow.csv.write_csv(flagged.cast(pa.schema(
+            [pa.field(f.name, f.type.value_type if pa.types.is_dictionary(f.type) else f.type) for f in flagged.schema]
+        )), args.flagged)
+        print(f"Wrote {flagged.num_rows:,} flagged answers to {args.flagged}")
+
+
+if __name__ == "__main__":
+    main()
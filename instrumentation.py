@@ -0,0 +1,250 @@
+"""Opt-in timing of app script runs.
+
+Enabled with MARKSHEET_PROFILE=1. Each script (or fragment) run records the
+time spent in named sections, loader cache hits/misses and the size of the
+session state, and appends one JSON line to a rotating log. When profiling
+is off, section() hands back a shared no-op context manager and the loader
+wrappers are not installed, so the cost is a function call per section.
+
+Add ?admin=1 to the app URL to see p50/p95 per section in the sidebar.
+"""
+import contextlib
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import Counter
+from logging.handlers import RotatingFileHandler
+
+import config
+
+ENABLED = config.PROFILE
+
+_NULL = contextlib.nullcontext()
+_local = threading.local()  # Streamlit runs each session's script on its own thread
+_logger = None
+
+
+def _get_logger():
+    global _logger
+    if _logger is None:
+        os.makedirs(os.path.dirname(config.PROFILE_LOG) or ".", exist_ok=True)
+        logger = logging.getLogger("marksheet.profile")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        if not logger.handlers:
+            handler = RotatingFileHandler(
+                config.PROFILE_LOG, maxBytes=config.PROFILE_LOG_BYTES, backupCount=config.PROFILE_LOG_BACKUPS,
+                encoding="utf-8",
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+        _logger = logger
+    return _logger
+
+
+class _Section:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        run = getattr(_local, "run", None)
+        if run is not None:
+            run["sections"][self.name] = run["sections"].get(self.name, 0.0) + (time.perf_counter() - self.started) * 1000
+        return False
+
+
+def section(name):
+    """Time a named block of the current run: ``with section("pdf_viewer"): ...``"""
+    if not ENABLED:
+        return _NULL
+    return _Section(name)
+
+
+def start_run(kind="script"):
+    """Begin recording a script or fragment run.
+
+    A run cut short by st.rerun() never reaches finish_run(), so it is
+    flushed here when the next run on the same thread starts.
+    """
+    if not ENABLED:
+        return
+    previous = getattr(_local, "run", None)
+    if previous is not None:
+        _flush(previous, None, interrupted=True)
+    _local.run = {"kind": kind, "started": time.perf_counter(), "sections": {}, "counters": Counter()}
+
+
+def finish_run(session_state=None):
+    """Write the current run's record; call before st.stop() and at the end of a run."""
+    if not ENABLED:
+        return
+    run = getattr(_local, "run", None)
+    if run is not None:
+        _local.run = None
+        _flush(run, session_state)
+
+
+def count(name, amount=1):
+    if not ENABLED:
+        return
+    run = getattr(_local, "run", None)
+    if run is not None:
+        run["counters"][name] += amount
+
+
+def counted_loader(name):
+    """Decorator for cached loaders: counts calls; the loader body counts misses.
+
+    Put it outside the cache decorator and call ``count(f"{name}.miss")``
+    inside the loader body, which only runs on a cache miss.
+    """
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        def wrapper(*args, **kwargs):
+            count(f"{name}.calls")
+            return fn(*args, **kwargs)
+
+        wrapper.__wrapped__ = fn
+        wrapper.__name__ = fn.__name__
+        return wrapper
+    return decorate
+
+
+def fragment(kind, session_state=None):
+    """Decorator (under @st.fragment) recording fragment-only reruns as their own runs.
+
+    During a full script run the fragment is timed as a section of that run.
+    """
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        def wrapper(*args, **kwargs):
+            if getattr(_local, "run", None) is not None:
+                with _Section(f"fragment:{kind}"):
+                    return fn(*args, **kwargs)
+            start_run(f"fragment:{kind}")
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                finish_run(session_state)
+
+        wrapper.__wrapped__ = fn
+        wrapper.__name__ = fn.__name__
+        return wrapper
+    return decorate
+
+
+def _state_size(session_state):
+    total = 0
+    for key in list(session_state.keys()):
+        try:
+            total += len(pickle.dumps(session_state[key], protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            continue
+    return total
+
+
+def _flush(run, session_state, interrupted=False):
+    import doc_cache
+    import shared_cache
+
+    counters = dict(run["counters"])
+    for key in [k for k in counters if k.endswith(".calls")]:
+        name = key[:-len(".calls")]
+        counters[f"{name}.hits"] = counters[key] - counters.get(f"{name}.miss", 0)
+    record = {
+        "ts": time.time(),
+        "kind": run["kind"],
+        "total_ms": round((time.perf_counter() - run["started"]) * 1000, 3),
+        "interrupted": interrupted,
+        "sections": {k: round(v, 3) for k, v in run["sections"].items()},
+        "counters": counters,
+        "doc_cache": doc_cache.stats(),
+        "shared_cache": shared_cache.stats(),
+    }
+    if session_state is not None:
+        record["session_state_bytes"] = _state_size(session_state)
+    try:
+        _get_logger().info(json.dumps(record, separators=(",", ":")))
+    except OSError:
+        pass
+
+
+def read_log(limit=5000):
+    """The most recent records from the profile log (current file plus backups)."""
+    records = []
+    paths = [config.PROFILE_LOG] + [f"{config.PROFILE_LOG}.{i}" for i in range(1, config.PROFILE_LOG_BACKUPS + 1)]
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except OSError:
+            continue
+        for line in reversed(lines):
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+            if len(records) >= limit:
+                return records
+    return records
+
+
+def section_percentiles(records):
+    """p50/p95/count per section (plus the whole run) as a DataFrame."""
+    import pandas as pd
+
+    rows = []
+    for rec in records:
+        rows.append((rec["kind"], "(total)", rec["total_ms"]))
+        rows.extend((rec["kind"], name, ms) for name, ms in rec["sections"].items())
+    if not rows:
+        return pd.DataFrame(columns=["kind", "section", "runs", "p50_ms", "p95_ms"])
+    frame = pd.DataFrame(rows, columns=["kind", "section", "ms"])
+    grouped = frame.groupby(["kind", "section"])["ms"]
+    return pd.DataFrame({
+        "runs": grouped.size(),
+        "p50_ms": grouped.quantile(0.5).round(2),
+        "p95_ms": grouped.quantile(0.95).round(2),
+    }).reset_index().sort_values("p95_ms", ascending=False)
+
+
+def admin_panel(st):
+    """Sidebar summary of the profile log; shown only with ?admin=1."""
+    if not ENABLED or st.query_params.get("admin") != "1":
+        return
+    with st.sidebar:
+        st.subheader("Profiling")
+        records = read_log()
+        st.caption(f"{len(records)} recent run(s) from `{config.PROFILE_LOG}`")
+        st.dataframe(section_percentiles(records), hide_index=True, use_container_width=True)
+        counters = Counter()
+        for rec in records:
+            counters.update(rec.get("counters", {}))
+        if counters:
+            st.dataframe(
+                [{"counter": k, "total": v} for k, v in sorted(counters.items())],
+                hide_index=True, use_container_width=True,
+            )
+        sizes = sorted(rec["session_state_bytes"] for rec in records if "session_state_bytes" in rec)
+        if sizes:
+            st.caption(
+                f"Session state: p50 {sizes[len(sizes) // 2] / 1024:,.1f} KB, "
+                f"p95 {sizes[min(len(sizes) - 1, int(len(sizes) * 0.95))] / 1024:,.1f} KB"
+            )
+        if records:
+            st.caption(f"Document cache: {records[0]['doc_cache']}")
+            if "shared_cache" in records[0]:
+                st.caption(f"Shared cache: {records[0]['shared_cache']}")
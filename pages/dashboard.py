@@ -0,0 +1,132 @@
+import streamlit as st
+import pandas as pd
+
+import catalog
+import config
+import results_store
+
+st.set_page_config(layout="wide", page_title="Grading Dashboard", page_icon="📊")
+st.title("📊 Grading Dashboard")
+
+# Summaries come from aggregate tables in the results database that are
+# updated as evaluations are saved (see results_store.py); JSON logs dropped
+# into outputs/ are imported when the folder's mtime changes.
+store = results_store.get_backend("sqlite")
+store.sync_directory(config.RESULTS_DIR)
+version = store.data_version()
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def distribution(version, protocol, by):
+    rows = store.rating_distribution(protocol, by)
+    frame = pd.DataFrame(rows, columns=[by, "rating", "n"])
+    table = frame.pivot_table(index=by, columns="rating", values="n", aggfunc="sum", fill_value=0)
+    table.columns = [f"Rating {c}" for c in table.columns]
+    counts = table.to_numpy()
+    ratings = frame["rating"].drop_duplicates().sort_values().to_numpy()
+    table.insert(0, "Ratings", counts.sum(axis=1))
+    table.insert(1, "Mean", (counts * ratings).sum(axis=1) / counts.sum(axis=1).clip(min=1))
+    return table.sort_index()
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def coverage(version):
+    return pd.DataFrame(store.document_graders(), columns=["document", "grader", "evaluations"])
+
+
+protocol_names = store.protocols()
+if not protocol_names:
+    st.info(f"No evaluations yet. Saved evaluations and JSON logs in `{config.RESULTS_DIR}/` will show up here.")
+    st.stop()
+
+# -----------------------------
+# Progress and coverage
+# -----------------------------
+graders = coverage(version)
+graders_per_doc = graders.groupby("document")["grader"].nunique()
+_, catalog_docs = catalog.search("", page=0, page_size=1)
+k = config.GRADERS_PER_DOCUMENT
+complete = int((graders_per_doc >= k).sum())
+
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Evaluations", f"{int(graders['evaluations'].sum()):,}")
+col2.metric("Documents graded", f"{len(graders_per_doc):,}", help=f"{catalog_docs:,} in the catalog")
+col3.metric("Graders", f"{graders['grader'].str.lower().nunique():,}")
+col4.metric(f"Documents with {k}+ graders", f"{complete:,}")
+if catalog_docs:
+    st.progress(min(1.0, complete / catalog_docs), text=f"{complete:,} of {catalog_docs:,} catalog documents fully covered")
+
+cov_col, grader_col = st.columns(2)
+with cov_col:
+    st.subheader("Graders per document")
+    histogram = graders_per_doc.value_counts().sort_index()
+    histogram.index.name = "graders"
+    st.bar_chart(histogram.rename("documents"))
+with grader_col:
+    st.subheader("Evaluations per grader")
+    per_grader = graders.groupby(graders["grader"].str.upper())["evaluations"].sum().sort_values(ascending=False)
+    st.dataframe(per_grader.rename("evaluations"), use_container_width=True, height=300)
+
+# -----------------------------
+# Rating distributions
+# -----------------------------
+st.markdown("---")
+protocol = st.selectbox("Protocol", protocol_names, index=len(protocol_names) - 1)
+
+metric_tab, doc_tab, cell_tab = st.tabs(["By metric", "By document", "Evidence drill-down"])
+with metric_tab:
+    by_metric = distribution(version, protocol, "metric")
+    st.dataframe(by_metric, use_container_width=True, column_config={"Mean": st.column_config.NumberColumn(format="%.2f")})
+    st.bar_chart(by_metric.drop(columns=["Ratings", "Mean"]), horizontal=True)
+
+with doc_tab:
+    by_doc = distribution(version, protocol, "document")
+    doc_filter = st.text_input("Filter documents", placeholder="Name or part of it")
+    if doc_filter.strip():
+        by_doc = by_doc[by_doc.index.str.contains(doc_filter.strip(), case=False, regex=False)]
+    st.caption(f"{len(by_doc):,} document(s)")
+    st.dataframe(by_doc, use_container_width=True, column_config={"Mean": st.column_config.NumberColumn(format="%.2f")})
+
+    # Mean rating per document x metric, for a page of documents at a time
+    page_size = 50
+    n_pages = max(1, -(-len(by_doc) // page_size))
+    page = st.number_input(f"Document x metric means, page (of {n_pages})", min_value=1, max_value=n_pages, step=1) if n_pages > 1 else 1
+    shown = list(by_doc.index[(page - 1) * page_size:page * page_size])
+    if shown:
+        means = pd.DataFrame(store.mean_ratings(protocol, shown), columns=["document", "metric", "mean", "ratings"])
+        st.dataframe(
+            means.pivot(index="document", columns="metric", values="mean").round(2),
+            use_container_width=True,
+        )
+
+with cell_tab:
+    doc_col, metric_col = st.columns(2)
+    with doc_col:
+        cell_doc = st.selectbox("Document", list(distribution(version, protocol, "document").index),
+                                index=None, placeholder="Choose a document...")
+    with metric_col:
+        cell_metric = st.selectbox("Metric", list(by_metric.index), index=None, placeholder="Choose a metric...")
+    if cell_doc and cell_metric:
+        answers = pd.DataFrame(
+            store.cell_answers(protocol, cell_doc, cell_metric),
+            columns=["grader", "rating", "evidence", "notes", "found", "page", "match", "saved"],
+        )
+        if answers.empty:
+            st.info("No ratings for this document and metric.")
+        else:
+            answers["found"] = answers["found"].map({1: "✓", 0: "✗"})
+            answers["match"] = answers["match"] * 100
+            st.dataframe(
+                answers,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "evidence": st.column_config.TextColumn(width="large"),
+                    "match": st.column_config.NumberColumn(format="%.0f%%"),
+                },
+            )
+            for row in answers.itertuples():
+                with st.expander(f"{row.grader}: rating {row.rating}"):
+                    st.markdown(f"> {row.evidence}" if row.evidence else "_No evidence given_")
+                    if row.notes:
+                        st.caption(f"Notes: {row.notes}")
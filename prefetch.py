@@ -0,0 +1,79 @@
+"""Background preparation of the document a grader is about to open.
+
+prefetch(path) warms everything the first render of a document needs: for
+a PDF its bytes in the shared document cache, its page count and its text
+index for evidence checks; for a plain-text document (which may be too big
+to hold in memory) just its page offsets. It returns immediately; the work
+runs on a small thread pool shared by every session in the server process,
+and a document that is already queued, running, recently prepared or that
+failed to prepare is not submitted again, so two graders opening the same
+document trigger one job. Documents are keyed by (path, mtime, size), so a
+broken file is retried once it changes.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import doc_cache
+import documents
+import textindex
+import textview
+
+logger = logging.getLogger(__name__)
+
+# Prepared (or failed) documents remembered so they are not prefetched again
+MAX_DONE = 256
+MAX_FAILED = 256
+
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=config.PREFETCH_WORKERS, thread_name_prefix="prefetch")
+_jobs = {}  # document key -> Future
+_done = OrderedDict()  # document key -> None, most recently prepared last
+_failed = OrderedDict()  # document key -> None, most recent failure last
+
+
+def _prepare(key):
+    path = key[0]
+    if textindex.indexable(path):
+        doc_cache.read(path)
+        documents.page_count(path)
+        # Extraction has its own pool and deduplication; wait so this worker
+        # does not start the next document before the text is ready
+        textindex.get_index(path, wait=True)
+    elif textview.is_text(path):
+        textview.page_count(path)
+
+
+def _finished(key, future):
+    error = future.exception()
+    with _lock:
+        _jobs.pop(key, None)
+        remembered, limit = (_done, MAX_DONE) if error is None else (_failed, MAX_FAILED)
+        remembered[key] = None
+        while len(remembered) > limit:
+            remembered.popitem(last=False)
+    if error is not None:
+        logger.warning("Prefetching %s failed: %s", key[0], error)
+
+
+def prefetch(path):
+    """Start preparing a document in the background; returns at once."""
+    if not path:
+        return
+    try:
+        key = doc_cache.DocumentCache.key_for(path)
+    except OSError:
+        return
+    with _lock:
+        if key in _done or key in _failed or key in _jobs:
+            return
+        future = _executor.submit(_prepare, key)
+        _jobs[key] = future
+    future.add_done_callback(lambda f: _finished(key, f))
+
+
+def pending():
+    with _lock:
+        return len(_jobs)
@@ -0,0 +1,248 @@
+"""Compiled grading protocols.
+
+The spreadsheets in data/ stay the source of truth, but reading them needs
+pandas + openpyxl. Each spreadsheet is compiled once into a small JSON
+artifact under the cache folder, and the app works from the immutable
+Protocol objects loaded from that artifact.
+
+Graders work through a pipeline of protocols (stages) defined in
+data/protocols.json, e.g. a 2-point screening followed by the 5-point
+protocol. Everything a metric needs on screen (rating values, selectbox
+labels, guidance table) is built once when the pipeline is loaded.
+"""
+import hashlib
+import json
+import os
+import re
+from dataclasses import dataclass, field
+
+import config
+import shared_cache
+
+# Bump whenever the compiled layout changes so stale artifacts get rebuilt
+COMPILED_VERSION = 1
+
+RATING_COLUMN = re.compile(r"^Rating\s+(\d+)")
+
+# Rating descriptions longer than this are cut short in the rating selectbox
+LABEL_LENGTH = 50
+
+# Used when data/protocols.json does not exist
+DEFAULT_STAGES = (
+    {"name": "2-point", "spreadsheet": "GradingProtocol-2point.xlsx"},
+    {"name": "5-point", "spreadsheet": "GradingProtocol-5point.xlsx"},
+)
+
+
+@dataclass(frozen=True, slots=True)
+class Rating:
+    value: int
+    column: str
+    description: str
+
+
+@dataclass(frozen=True, slots=True)
+class Metric:
+    name: str
+    definition: str
+    ratings: tuple  # Rating objects, highest value first
+    values: tuple = ()  # rating values, in the same order
+    labels: dict = field(default_factory=dict, compare=False, repr=False)  # value -> selectbox label
+    guidance: object = field(default=None, compare=False, repr=False)  # DataFrame shown above the rating
+
+
+@dataclass(frozen=True, slots=True)
+class Protocol:
+    name: str
+    source: str
+    metrics: tuple
+
+    def __len__(self):
+        return len(self.metrics)
+
+    def __getitem__(self, index):
+        return self.metrics[index]
+
+
+@dataclass(frozen=True, slots=True)
+class Pipeline:
+    stages: tuple  # Protocol objects, in grading order
+
+    def __len__(self):
+        return len(self.stages)
+
+    def __getitem__(self, index):
+        return self.stages[index]
+
+    def index_of(self, name):
+        for i, stage in enumerate(self.stages):
+            if stage.name == name:
+                return i
+        raise KeyError(name)
+
+    @property
+    def spreadsheets(self):
+        return [stage.source for stage in self.stages]
+
+
+def normalize_metric(name):
+    # Strip regular and non-breaking spaces
+    return str(name).replace("\xa0", " ").strip()
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _artifact_path(source):
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(config.CACHE_DIR, "protocols", f"{stem}.json")
+
+
+def _compile_rows(source):
+    # Only the compile step needs pandas/openpyxl
+    import pandas as pd
+
+    df = pd.read_excel(source)
+    df = df.dropna(subset=["Metric"])
+
+    rating_columns = []
+    for col in df.columns:
+        match = RATING_COLUMN.match(str(col))
+        if match:
+            rating_columns.append((int(match.group(1)), str(col)))
+    rating_columns.sort(reverse=True)
+
+    metrics = []
+    for _, row in df.iterrows():
+        definition = row.get("Metric Defination")
+        metrics.append({
+            "name": normalize_metric(row["Metric"]),
+            "definition": str(definition) if pd.notna(definition) else "",
+            "ratings": [
+                [value, col, str(row[col]) if pd.notna(row[col]) else ""]
+                for value, col in rating_columns
+            ],
+        })
+    return metrics
+
+
+def _write_artifact(path, artifact):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(artifact, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def _read_artifact(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            artifact = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if artifact.get("version") != COMPILED_VERSION:
+        return None
+    return artifact
+
+
+def compiled_artifact(filename):
+    """Return the compiled artifact for a spreadsheet, rebuilding it if stale.
+
+    The mtime/size pair is the fast path; when it changes the content hash
+    decides whether the spreadsheet really needs to be parsed again.
+    """
+    source = os.path.join(config.DATA_DIR, filename)
+    path = _artifact_path(source)
+    artifact = _read_artifact(path)
+
+    try:
+        stat = os.stat(source)
+    except FileNotFoundError:
+        # A deployment may ship only the compiled artifact
+        if artifact is None:
+            raise
+        return artifact
+
+    if artifact and artifact["mtime_ns"] == stat.st_mtime_ns and artifact["size"] == stat.st_size:
+        return artifact
+
+    digest = _file_digest(source)
+    if artifact is None or artifact["sha256"] != digest:
+        artifact = {
+            "version": COMPILED_VERSION,
+            "source": filename,
+            "sha256": digest,
+            # Shared by content hash, so server processes starting together
+            # parse the spreadsheet once between them
+            "metrics": shared_cache.json_value(
+                "protocols", f"{digest}.v{COMPILED_VERSION}.json", lambda: _compile_rows(source)
+            ),
+        }
+    artifact["mtime_ns"] = stat.st_mtime_ns
+    artifact["size"] = stat.st_size
+    _write_artifact(path, artifact)
+    return artifact
+
+
+def rating_label(value, description):
+    if len(description) > LABEL_LENGTH:
+        return f"{value} - {description[:LABEL_LENGTH]}..."
+    return f"{value} - {description}"
+
+
+def _metric(m):
+    import pandas as pd
+
+    ratings = tuple(Rating(value, column, description) for value, column, description in m["ratings"])
+    return Metric(
+        name=m["name"],
+        definition=m["definition"],
+        ratings=ratings,
+        values=tuple(r.value for r in ratings),
+        labels={r.value: rating_label(r.value, r.description) for r in ratings},
+        guidance=pd.DataFrame({
+            "Rating": [r.column for r in ratings],
+            "What it means": [r.description for r in ratings],
+        }),
+    )
+
+
+def load(filename, name):
+    """Load a protocol spreadsheet as an immutable Protocol."""
+    artifact = compiled_artifact(filename)
+    metrics = tuple(_metric(m) for m in artifact["metrics"])
+    return Protocol(name=name, source=filename, metrics=metrics)
+
+
+def pipeline_stages(path=None):
+    """Stage definitions ({"name", "spreadsheet"}) from the pipeline config."""
+    path = path or config.PIPELINE
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            stages = json.load(f)["stages"]
+    except FileNotFoundError:
+        return [dict(stage) for stage in DEFAULT_STAGES]
+    names = [stage["name"] for stage in stages]
+    if not stages or len(set(names)) != len(names):
+        raise ValueError(f"{path}: stages must be a non-empty list with unique names")
+    return stages
+
+
+def load_pipeline(path=None):
+    """Load every stage of the grading pipeline."""
+    return Pipeline(stages=tuple(
+        load(stage["spreadsheet"], stage["name"]) for stage in pipeline_stages(path)
+    ))
+
+
+if __name__ == "__main__":
+    # Precompile every spreadsheet, e.g. as a deployment build step
+    for f in sorted(os.listdir(config.DATA_DIR)):
+        if f.endswith(".xlsx") and not f.startswith("~$"):
+            artifact = compiled_artifact(f)
+            print(f"{f}: {len(artifact['metrics'])} metrics -> {_artifact_path(f)}")
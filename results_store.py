@@ -0,0 +1,491 @@
+"""Storage for finished evaluations.
+
+Two backends share one interface (``save(output) -> location``):
+
+* ``SQLiteBackend`` (default) keeps every evaluation in one WAL-mode SQLite
+  database with one indexed row per (document, grader, protocol, metric).
+* ``JsonDirectoryBackend`` writes one JSON file per evaluation to outputs/,
+  which is what the app originally did.
+
+Run ``python results_store.py import outputs/*.json`` to load existing JSON
+logs (old flat ``results`` or nested ``results["2-point"/"5-point"]``) into
+the database.
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from functools import lru_cache
+
+import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS evaluations (
+    evaluation_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    grader TEXT NOT NULL,
+    document TEXT NOT NULL,
+    tag TEXT,
+    protocols TEXT NOT NULL,
+    source TEXT UNIQUE
+);
+CREATE INDEX IF NOT EXISTS evaluations_document_grader ON evaluations(document, grader);
+
+CREATE TABLE IF NOT EXISTS ratings (
+    evaluation_id TEXT NOT NULL REFERENCES evaluations(evaluation_id) ON DELETE CASCADE,
+    document TEXT NOT NULL,
+    grader TEXT NOT NULL,
+    protocol TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    rating INTEGER,
+    evidence TEXT,
+    notes TEXT,
+    evidence_found INTEGER,
+    evidence_page INTEGER,
+    evidence_score REAL,
+    PRIMARY KEY (evaluation_id, protocol, metric)
+);
+CREATE INDEX IF NOT EXISTS ratings_lookup ON ratings(document, grader, protocol, metric);
+
+-- Aggregates for the dashboard, kept current by triggers on every insert/delete
+CREATE TABLE IF NOT EXISTS rating_counts (
+    protocol TEXT NOT NULL,
+    document TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    rating INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (protocol, document, metric, rating)
+);
+-- Covering indexes for the per-metric and per-document distributions
+CREATE INDEX IF NOT EXISTS rating_counts_metric ON rating_counts(protocol, metric, rating, n);
+CREATE INDEX IF NOT EXISTS rating_counts_document ON rating_counts(protocol, document, rating, n);
+CREATE TABLE IF NOT EXISTS document_graders (
+    document TEXT NOT NULL,
+    grader TEXT NOT NULL COLLATE NOCASE,
+    evaluations INTEGER NOT NULL,
+    PRIMARY KEY (document, grader)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+CREATE TRIGGER IF NOT EXISTS rating_counts_insert AFTER INSERT ON ratings WHEN NEW.rating IS NOT NULL BEGIN
+    INSERT INTO rating_counts (protocol, document, metric, rating, n)
+    VALUES (NEW.protocol, NEW.document, NEW.metric, NEW.rating, 1)
+    ON CONFLICT (protocol, document, metric, rating) DO UPDATE SET n = n + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS rating_counts_delete AFTER DELETE ON ratings WHEN OLD.rating IS NOT NULL BEGIN
+    UPDATE rating_counts SET n = n - 1
+    WHERE protocol = OLD.protocol AND document = OLD.document AND metric = OLD.metric AND rating = OLD.rating;
+END;
+CREATE TRIGGER IF NOT EXISTS document_graders_insert AFTER INSERT ON evaluations BEGIN
+    INSERT INTO document_graders (document, grader, evaluations) VALUES (NEW.document, NEW.grader, 1)
+    ON CONFLICT (document, grader) DO UPDATE SET evaluations = evaluations + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS document_graders_delete AFTER DELETE ON evaluations BEGIN
+    UPDATE document_graders SET evaluations = evaluations - 1
+    WHERE document = OLD.document AND grader = OLD.grader;
+END;
+"""
+
+# Bump to rebuild the aggregate tables from scratch on the next start
+AGGREGATES_VERSION = "1"
+
+MIGRATIONS = [
+    ("evidence_found", "INTEGER"),
+    ("evidence_page", "INTEGER"),
+    ("evidence_score", "REAL"),
+]
+
+# Namespace for deterministic IDs of imported files, so re-imports are no-ops
+IMPORT_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "marksheet/outputs")
+
+
+def new_evaluation_id():
+    return uuid.uuid4().hex
+
+
+def protocol_name(spreadsheet):
+    # "GradingProtocol-5point.xlsx" -> "5-point"
+    match = re.search(r"(\d+)\s*-?\s*point", spreadsheet or "")
+    return f"{match.group(1)}-point" if match else os.path.splitext(spreadsheet or "unknown")[0]
+
+
+def iter_answers(output):
+    """Yield (protocol, metric, answer) from an evaluation log.
+
+    Handles the old flat layout (``results[metric]`` plus
+    ``metadata["protocol"]``) and the current nested one
+    (``results[protocol][metric]``).
+    """
+    metadata = output.get("metadata", {})
+    results = output.get("results", {})
+    flat = all(isinstance(v, dict) and "rating" in v for v in results.values())
+    if flat:
+        protocol = protocol_name(metadata.get("protocol"))
+        for metric, answer in results.items():
+            yield protocol, metric, answer
+    else:
+        for protocol, answers in results.items():
+            for metric, answer in (answers or {}).items():
+                yield protocol, metric, answer
+
+
+def _verification_columns(verification):
+    if not verification:
+        return (None, None, None)
+    return (int(bool(verification.get("found"))), verification.get("page"), verification.get("score"))
+
+
+def output_filename(metadata):
+    safe = lambda s: ("".join(ch if ch.isalnum() else "_" for ch in (s or "").strip())) or "unnamed"
+    timestamp = datetime.fromisoformat(metadata["date"]).strftime("%Y%m%dT%H%M%SZ")
+    parts = []
+    if (metadata.get("tag") or "").strip():
+        parts.append(safe(metadata["tag"]))
+    parts.extend([safe(metadata["grader_name"]), safe(metadata["document_name"]), timestamp])
+    return f"{'_'.join(parts)}.json"
+
+
+class JsonDirectoryBackend:
+    def __init__(self, folder=None):
+        self.folder = folder or config.RESULTS_DIR
+
+    def save(self, output):
+        os.makedirs(self.folder, exist_ok=True)
+        base = os.path.join(self.folder, output_filename(output["metadata"]))
+        # Written in full under a name readers skip (not *.json), then linked
+        # into place, so sync_directory and aggregate.scan never see a partial file
+        tmp = f"{base}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2)
+        try:
+            path = base
+            suffix = 1
+            while True:
+                try:
+                    # Fails if the name is taken: never overwrite an evaluation saved in the same second
+                    os.link(tmp, path)
+                    return path
+                except FileExistsError:
+                    path = f"{os.path.splitext(base)[0]}_{suffix}.json"
+                    suffix += 1
+        finally:
+            os.remove(tmp)
+
+    def graded_documents(self, grader):
+        """Names of documents this grader has already evaluated."""
+        import aggregate
+
+        frame = aggregate.scan(self.folder)
+        graded = frame.loc[frame["grader"].astype(str).str.lower() == grader.strip().lower(), "doc"]
+        return set(graded.astype(str))
+
+    def graded_pairs(self):
+        """Every (document, grader) pair with a stored evaluation."""
+        import aggregate
+
+        frame = aggregate.scan(self.folder)
+        return set(frame[["doc", "grader"]].astype(str).itertuples(index=False, name=None))
+
+
+class SQLiteBackend:
+    def __init__(self, path=None):
+        self.path = path or config.RESULTS_DB
+        # Folder -> mtime this process last synced (see sync_directory)
+        self._synced = {}
+        with self.connect() as conn:
+            conn.executescript(SCHEMA)
+            self._migrate(conn)
+
+    @staticmethod
+    def _migrate(conn):
+        # Columns added after the first release of the schema
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(ratings)")}
+        for column, kind in MIGRATIONS:
+            if column not in existing:
+                conn.execute(f"ALTER TABLE ratings ADD COLUMN {column} {kind}")
+        # Databases created before the aggregate tables existed: fill them once
+        built = conn.execute("SELECT value FROM meta WHERE key = 'aggregates'").fetchone()
+        if not built or built[0] != AGGREGATES_VERSION:
+            conn.execute("DELETE FROM rating_counts")
+            conn.execute(
+                "INSERT INTO rating_counts (protocol, document, metric, rating, n) "
+                "SELECT protocol, document, metric, rating, COUNT(*) FROM ratings WHERE rating IS NOT NULL "
+                "GROUP BY protocol, document, metric, rating"
+            )
+            conn.execute("DELETE FROM document_graders")
+            conn.execute(
+                "INSERT INTO document_graders (document, grader, evaluations) "
+                "SELECT document, grader, COUNT(*) FROM evaluations GROUP BY document, grader COLLATE NOCASE"
+            )
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('aggregates', ?)", (AGGREGATES_VERSION,))
+
+    def connect(self):
+        # One short-lived connection per call: Streamlit sessions run on different threads
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def _insert(self, conn, output, source=None):
+        metadata = output["metadata"]
+        evaluation_id = metadata.get("evaluation_id") or new_evaluation_id()
+        grader = metadata.get("grader_name") or "Unknown"
+        document = metadata.get("document_name") or "Unknown"
+        protocols = metadata.get("protocols") or [metadata.get("protocol")]
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO evaluations (evaluation_id, created_at, grader, document, tag, protocols, source) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (evaluation_id, metadata.get("date") or datetime.utcnow().isoformat(), grader, document,
+             metadata.get("tag"), json.dumps(protocols), source),
+        )
+        if cur.rowcount == 0:
+            return None
+        conn.executemany(
+            "INSERT INTO ratings (evaluation_id, document, grader, protocol, metric, rating, evidence, notes, "
+            "evidence_found, evidence_page, evidence_score) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (evaluation_id, document, grader, protocol, metric,
+                 answer.get("rating"), answer.get("evidence"), answer.get("notes"))
+                + _verification_columns(answer.get("verification"))
+                for protocol, metric, answer in iter_answers(output)
+            ],
+        )
+        return evaluation_id
+
+    def save(self, output):
+        conn = self.connect()
+        try:
+            with conn:  # one transaction: the evaluation and all its ratings, or nothing
+                evaluation_id = self._insert(conn, output)
+        finally:
+            conn.close()
+        if evaluation_id is None:
+            raise ValueError(f"Evaluation {output['metadata'].get('evaluation_id')} is already stored")
+        return f"{self.path}#{evaluation_id}"
+
+    def graded_documents(self, grader):
+        """Names of documents this grader has already evaluated."""
+        conn = self.connect()
+        try:
+            rows = conn.execute(
+                "SELECT DISTINCT document FROM evaluations WHERE grader = ? COLLATE NOCASE", (grader.strip(),)
+            ).fetchall()
+        finally:
+            conn.close()
+        return {document for (document,) in rows}
+
+    def graded_pairs(self):
+        """Every (document, grader) pair with a stored evaluation."""
+        conn = self.connect()
+        try:
+            rows = conn.execute("SELECT DISTINCT document, grader FROM evaluations").fetchall()
+        finally:
+            conn.close()
+        return set(rows)
+
+    def import_files(self, paths):
+        """Import JSON evaluation logs; returns (imported, skipped)."""
+        imported = skipped = 0
+        conn = self.connect()
+        try:
+            for path in paths:
+                source = os.path.basename(path)
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        output = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"Skipping {path}: {e}")
+                    skipped += 1
+                    continue
+                output.setdefault("metadata", {})
+                output["metadata"].setdefault("evaluation_id", uuid.uuid5(IMPORT_NAMESPACE, source).hex)
+                with conn:
+                    if self._insert(conn, output, source=source):
+                        imported += 1
+                    else:
+                        skipped += 1
+        finally:
+            conn.close()
+        return imported, skipped
+
+    def sync_directory(self, folder=None):
+        """Import JSON logs added to folder since the last sync; returns how many.
+
+        Skipped entirely while the folder's mtime is unchanged (without opening
+        the database if this process already synced that mtime), so it is
+        cheap enough to call on every dashboard rerun.
+        """
+        folder = folder or config.RESULTS_DIR
+        try:
+            mtime_ns = str(os.stat(folder).st_mtime_ns)
+        except FileNotFoundError:
+            return 0
+        key = f"synced:{os.path.abspath(folder)}"
+        if self._synced.get(key) == mtime_ns:
+            return 0
+        conn = self.connect()
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            if row and row[0] == mtime_ns:
+                self._synced[key] = mtime_ns
+                return 0
+            known = {source for (source,) in conn.execute("SELECT source FROM evaluations WHERE source IS NOT NULL")}
+        finally:
+            conn.close()
+        new = sorted(
+            os.path.join(folder, name) for name in os.listdir(folder)
+            if name.endswith(".json") and name not in known
+        )
+        imported, _ = self.import_files(new)
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, mtime_ns))
+        finally:
+            conn.close()
+        self._synced[key] = mtime_ns
+        return imported
+
+    def _query(self, sql, params=()):
+        conn = self.connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def data_version(self):
+        """Changes whenever evaluations are added or removed; for caching summaries."""
+        return tuple(self._query("SELECT COUNT(*), MAX(rowid) FROM evaluations")[0])
+
+    def protocols(self):
+        return [p for (p,) in self._query("SELECT DISTINCT protocol FROM rating_counts WHERE n > 0 ORDER BY protocol")]
+
+    def rating_distribution(self, protocol, by):
+        """(document or metric, rating, count) rows for one protocol, from the aggregate table."""
+        if by not in ("document", "metric"):
+            raise ValueError(f"Unknown grouping {by!r}; expected 'document' or 'metric'")
+        return self._query(
+            f"SELECT {by}, rating, SUM(n) FROM rating_counts WHERE protocol = ? AND n > 0 GROUP BY {by}, rating",
+            (protocol,),
+        )
+
+    def mean_ratings(self, protocol, documents):
+        """(document, metric, mean rating, ratings) rows for the given documents."""
+        marks = ", ".join("?" * len(documents))
+        return self._query(
+            "SELECT document, metric, SUM(rating * n) * 1.0 / SUM(n), SUM(n) FROM rating_counts "
+            f"WHERE protocol = ? AND n > 0 AND document IN ({marks}) GROUP BY document, metric",
+            (protocol, *documents),
+        )
+
+    def document_graders(self):
+        """(document, grader, evaluations) rows from the aggregate table."""
+        return self._query("SELECT document, grader, evaluations FROM document_graders WHERE evaluations > 0")
+
+    def cell_answers(self, protocol, document, metric):
+        """Every grader's answer for one document x metric, with the evidence they quoted."""
+        return self._query(
+            "SELECT r.grader, r.rating, r.evidence, r.notes, r.evidence_found, r.evidence_page, r.evidence_score, "
+            "e.created_at FROM ratings r JOIN evaluations e USING (evaluation_id) "
+            "WHERE r.document = ? AND r.protocol = ? AND r.metric = ? ORDER BY r.grader, e.created_at",
+            (document, protocol, metric),
+        )
+
+    def export(self, evaluation_id):
+        """Rebuild the JSON evaluation log for a stored evaluation."""
+        conn = self.connect()
+        try:
+            row = conn.execute(
+                "SELECT created_at, grader, document, tag, protocols FROM evaluations WHERE evaluation_id = ?",
+                (evaluation_id,),
+            ).fetchone()
+            if row is None:
+                raise KeyError(evaluation_id)
+            ratings = conn.execute(
+                "SELECT protocol, metric, rating, evidence, notes, evidence_found, evidence_page, evidence_score "
+                "FROM ratings WHERE evaluation_id = ? ORDER BY rowid",
+                (evaluation_id,),
+            ).fetchall()
+        finally:
+            conn.close()
+        created_at, grader, document, tag, protocols = row
+        results = {}
+        for protocol, metric, rating, evidence, notes, found, page, score in ratings:
+            answer = {"rating": rating, "evidence": evidence, "notes": notes}
+            if found is not None:
+                answer["verification"] = {"found": bool(found), "page": page, "score": score}
+            results.setdefault(protocol, {})[metric] = answer
+        return {
+            "metadata": {
+                "evaluation_id": evaluation_id,
+                "date": created_at,
+                "protocols": json.loads(protocols),
+                "grader_name": grader,
+                "document_name": document,
+                "tag": tag,
+            },
+            "results": results,
+        }
+
+
+BACKENDS = {
+    "sqlite": SQLiteBackend,
+    "json": JsonDirectoryBackend,
+}
+
+
+# Where each backend keeps its data when no path is given
+DEFAULT_PATHS = {
+    "sqlite": lambda: config.RESULTS_DB,
+    "json": lambda: config.RESULTS_DIR,
+}
+
+
+def get_backend(name=None, path=None):
+    """The backend called name, storing under path (its configured location by default).
+
+    One instance per (name, path) is kept for the life of the process, so the
+    schema and migrations run once rather than on every save or lookup.
+    """
+    name = name or config.RESULTS_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown results backend {name!r}; expected one of {sorted(BACKENDS)}")
+    return _backend(name, os.path.abspath(path or DEFAULT_PATHS[name]()))
+
+
+@lru_cache(maxsize=None)
+def _backend(name, path):
+    return BACKENDS[name](path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the evaluation results database.")
+    parser.add_argument("--db", default=config.RESULTS_DB, help="SQLite database path")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_import = sub.add_parser("import", help="Import JSON evaluation logs")
+    p_import.add_argument("paths", nargs="*", help="JSON files (default: outputs/*.json)")
+    p_export = sub.add_parser("export", help="Print an evaluation as JSON")
+    p_export.add_argument("evaluation_id")
+    args = parser.parse_args(argv)
+
+    store = SQLiteBackend(args.db)
+    if args.command == "import":
+        paths = args.paths or sorted(glob.glob(os.path.join(config.RESULTS_DIR, "*.json")))
+        imported, skipped = store.import_files(paths)
+        print(f"Imported {imported} evaluation(s), skipped {skipped}")
+    elif args.command == "export":
+        print(json.dumps(store.export(args.evaluation_id), indent=2))
+
+
+if __name__ == "__main__":
+    main()
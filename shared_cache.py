@@ -0,0 +1,258 @@
+"""On-disk cache shared by every server process on a machine.
+
+Several ``streamlit run`` workers behind a load balancer each have their own
+memory, so anything derived from a protocol or a document (compiled
+protocols, content hashes, page counts, extracted text and word positions,
+text page offsets) is also kept here, where any worker can pick it up warm.
+
+Entries are files under SHARED_CACHE_DIR/<namespace>/<key>; keys are built
+from content hashes (plus a format version), so an entry never goes stale,
+it just stops being used. Writes go to a temporary file and are renamed
+into place, so readers never see a partial entry. A value that is expensive
+to build is built under an exclusive fcntl lock, so concurrent workers
+missing the same key do the work once. Each hit refreshes the file's mtime,
+and once the cache outgrows SHARED_CACHE_BYTES the least recently used
+entries are deleted.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, writes stay atomic
+    fcntl = None
+
+LOCK_DIR = ".locks"
+
+# Keys are spread over this many lock files, so locking never creates files
+# per entry and eviction never has to delete a lock someone may be holding
+LOCK_STRIPES = 256
+
+# Hits refresh an entry's mtime (its last use) at most this often
+TOUCH_SECONDS = 60
+
+# Eviction trims the cache to this share of its budget, so it doesn't run
+# again on the very next write
+EVICT_TO = 0.9
+
+
+class SharedCache:
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Bytes written since this process last checked the cache size; None
+        # until the first write, which always checks
+        self._written = None
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.evictions = 0
+
+    def _path(self, namespace, key):
+        return os.path.join(self.root, namespace, key)
+
+    def get(self, namespace, key):
+        """The stored bytes, or None."""
+        path = self._path(namespace, key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+                mtime = os.fstat(f.fileno()).st_mtime
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        if time.time() - mtime > TOUCH_SECONDS:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, namespace, key, data):
+        path = self._path(namespace, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            check = self._written is None or self._written + len(data) > self.max_bytes // 20
+            self._written = 0 if check else self._written + len(data)
+        if check:
+            self.evict()
+
+    @contextmanager
+    def lock(self, namespace, key):
+        """Exclusive lock for one key, across threads and processes."""
+        if fcntl is None:
+            yield
+            return
+        stripe = int(hashlib.sha1(f"{namespace}/{key}".encode()).hexdigest()[:8], 16) % LOCK_STRIPES
+        path = os.path.join(self.root, LOCK_DIR, f"{stripe:03d}.lock")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A separate open file per call: flock then also excludes other
+        # threads of this process
+        with open(path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def get_or_build(self, namespace, key, build):
+        """The stored bytes for key, calling build() (once across workers) on a miss."""
+        data = self.get(namespace, key)
+        if data is not None:
+            return data
+        with self.lock(namespace, key):
+            # Another worker may have built it while we waited
+            data = self.get(namespace, key)
+            if data is not None:
+                return data
+            data = build()
+            with self._lock:
+                self.builds += 1
+            self.put(namespace, key, data)
+        return data
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits its budget.
+
+        Only one process evicts at a time; the others skip it.
+        """
+        if fcntl is not None:
+            os.makedirs(os.path.join(self.root, LOCK_DIR), exist_ok=True)
+            guard = open(os.path.join(self.root, LOCK_DIR, "evict.lock"), "a")
+            try:
+                fcntl.flock(guard, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                guard.close()
+                return 0
+        else:
+            guard = None
+        try:
+            entries = []
+            total = 0
+            now = time.time()
+            for namespace in os.scandir(self.root):
+                if not namespace.is_dir() or namespace.name == LOCK_DIR:
+                    continue
+                for entry in os.scandir(namespace.path):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    if entry.name.endswith(".tmp"):
+                        # Left behind by a worker that died mid-write
+                        if now - stat.st_mtime > 3600:
+                            _remove(entry.path)
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            removed = 0
+            if total > self.max_bytes:
+                entries.sort()
+                for _, size, path in entries:
+                    if total <= self.max_bytes * EVICT_TO:
+                        break
+                    if _remove(path):
+                        total -= size
+                        removed += 1
+            with self._lock:
+                self.evictions += removed
+            return removed
+        finally:
+            if guard is not None:
+                guard.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "builds": self.builds,
+                "evictions": self.evictions,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def _remove(path):
+    # Readers that already opened the file keep reading it after the unlink
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+
+# Module-level singleton, like doc_cache: one per server process, all of them
+# sharing the same folder.
+_cache = SharedCache(config.SHARED_CACHE_DIR, config.SHARED_CACHE_BYTES)
+
+
+def get(namespace, key):
+    return _cache.get(namespace, key)
+
+
+def put(namespace, key, data):
+    _cache.put(namespace, key, data)
+
+
+def lock(namespace, key):
+    return _cache.lock(namespace, key)
+
+
+def get_or_build(namespace, key, build):
+    return _cache.get_or_build(namespace, key, build)
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def get_json(namespace, key):
+    data = _cache.get(namespace, key)
+    return None if data is None else json.loads(data)
+
+
+def put_json(namespace, key, value):
+    _cache.put(namespace, key, _dumps(value))
+
+
+def json_value(namespace, key, build):
+    """Like get_or_build, for JSON-serializable values."""
+    return json.loads(_cache.get_or_build(namespace, key, lambda: _dumps(build())))
+
+
+def stats():
+    return _cache.stats()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or trim the shared on-disk cache.")
+    parser.add_argument("command", choices=["status", "evict"])
+    args = parser.parse_args()
+
+    if args.command == "evict":
+        print(f"Removed {_cache.evict()} entries")
+    sizes = {}
+    if os.path.isdir(_cache.root):
+        for namespace in os.scandir(_cache.root):
+            if namespace.is_dir() and namespace.name != LOCK_DIR:
+                files = [e.stat().st_size for e in os.scandir(namespace.path) if not e.name.endswith(".tmp")]
+                sizes[namespace.name] = (len(files), sum(files))
+    for namespace, (n, size) in sorted(sizes.items()):
+        print(f"{namespace}: {n} entries, {size / 2**20:.1f} MiB")
+    print(f"Total {sum(s for _, s in sizes.values()) / 2**20:.1f} of {_cache.max_bytes / 2**20:.0f} MiB")
@@ -0,0 +1,110 @@
+"""Regression tests for the assignment queue (assignments.py).
+
+Graders are separate processes claiming from one database, as they are
+behind several server workers, so the BEGIN IMMEDIATE serialization is
+exercised for real.
+
+    python -m pytest tests
+"""
+import math
+import multiprocessing
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import assignments  # noqa: E402
+import catalog  # noqa: E402
+import config  # noqa: E402
+
+N_DOCUMENTS = 20
+N_GRADERS = 60
+K = 2
+
+
+@pytest.fixture
+def queue(tmp_path):
+    """(assignments db, catalog db) with N_DOCUMENTS documents in the catalog."""
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for i in range(N_DOCUMENTS):
+        (docs / f"doc{i:02d}.pdf").write_bytes(b"%PDF-1.4\n")
+    catalog_db = str(tmp_path / "catalog.db")
+    catalog.refresh(str(docs), catalog_db)
+    return str(tmp_path / "assignments.db"), catalog_db
+
+
+def _grade_until_empty(args):
+    """One grader: claim and finish documents until the queue has nothing left for them."""
+    grader, db_path, catalog_db, expected_graders = args
+    finished = []
+    while True:
+        lease = assignments.claim(grader, k=K, db_path=db_path, catalog_db=catalog_db,
+                                  expected_graders=expected_graders)
+        if lease is None:
+            return finished
+        finished.append(lease["document"])
+        assignments.complete(grader, lease["document"], lease["path"], db_path=db_path)
+
+
+def _graders_per_document(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return dict(conn.execute(
+            "SELECT document, COUNT(*) FROM assignments WHERE status = 'done' GROUP BY document"
+        ).fetchall())
+    finally:
+        conn.close()
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+@pytest.mark.parametrize("expected_graders", [0, N_GRADERS])
+def test_concurrent_claims(queue, expected_graders):
+    db_path, catalog_db = queue
+    tasks = [(f"grader{g}", db_path, catalog_db, expected_graders) for g in range(N_GRADERS)]
+    with multiprocessing.get_context("fork").Pool(N_GRADERS) as pool:
+        finished = pool.map(_grade_until_empty, tasks)
+
+    # Every document ends up with exactly K graders, none of them twice
+    assert _graders_per_document(db_path) == {f"doc{i:02d}": K for i in range(N_DOCUMENTS)}
+    for documents in finished:
+        assert len(documents) == len(set(documents))
+    assert sum(len(documents) for documents in finished) == N_DOCUMENTS * K
+    if expected_graders:
+        share = math.ceil(N_DOCUMENTS * K / expected_graders)
+        assert max(len(documents) for documents in finished) <= share
+
+
+def test_fair_share_cap(queue):
+    db_path, catalog_db = queue
+    # Graders arriving one after another: without a cap the first takes everything it can
+    uncapped = _grade_until_empty(("first", db_path, catalog_db, 0))
+    assert len(uncapped) == N_DOCUMENTS
+
+    capped = _grade_until_empty(("second", db_path, catalog_db, 4))
+    assert len(capped) == math.ceil(N_DOCUMENTS * K / 4)
+
+
+def test_existing_lease_is_returned(queue):
+    db_path, catalog_db = queue
+    first = assignments.claim("a", k=K, db_path=db_path, catalog_db=catalog_db)
+    again = assignments.claim("a", k=K, db_path=db_path, catalog_db=catalog_db)
+    assert again["document"] == first["document"]
+    assert again["expires_at"] >= first["expires_at"]
+
+
+def test_expired_lease_returns_to_queue(queue, monkeypatch):
+    db_path, catalog_db = queue
+    monkeypatch.setattr(config, "ASSIGNMENT_LEASE_SECONDS", -1)
+    lease = assignments.claim("a", k=1, db_path=db_path, catalog_db=catalog_db)
+    assert assignments.current("a", db_path=db_path) is None
+
+    # With one grader per document, the lapsed document is free for someone else
+    monkeypatch.setattr(config, "ASSIGNMENT_LEASE_SECONDS", 3600)
+    others = [assignments.claim(f"b{i}", k=1, db_path=db_path, catalog_db=catalog_db)["document"]
+              for i in range(N_DOCUMENTS)]
+    assert lease["document"] in others
+    assert assignments.renew("a", lease["document"], db_path=db_path) is False
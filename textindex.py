@@ -0,0 +1,366 @@
+"""Document text extraction, evidence verification and highlighting.
+
+Text is extracted once per PDF, page by page, in a background thread and kept in the shared on-disk cache (see shared_cache.py), keyed by
+the SHA-256 of the file contents; the same pass records an estimated box for
+every word, used to highlight evidence in the PDF viewer. Plain-text
+documents are not indexed (they are streamed, see textview.py). From the text a
+TextIndex is built in memory: the document as a sequence of normalized word
+tokens plus an index of word trigrams. Checking a piece of evidence is an
+exact token-sequence search, falling back to trigram voting for text that
+was retyped or pasted with small differences.
+"""
+import io
+import logging
+import re
+import threading
+import unicodedata
+from bisect import bisect_right
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+
+import config
+import doc_cache
+import shared_cache
+
+logger = logging.getLogger(__name__)
+
+TEXT_VERSION = 1
+POSITIONS_VERSION = 1
+
+# In-memory indexes kept per process (by content hash)
+MAX_INDEXES = 16
+
+# Documents whose extraction failed, remembered so they are not retried on
+# every rerun; a changed file (new mtime/size) is tried again
+MAX_FAILED = 256
+
+WORD = re.compile(r"\w+")
+HYPHENATED_BREAK = re.compile(r"(\w)-\s*\n\s*(\w)")
+SEGMENT_BREAK = re.compile(r"\n\s*\n|\.{3,}|…")
+PUNCTUATION = str.maketrans({"‘": "'", "’": "'", "“": '"', "”": '"', "–": "-", "—": "-", "\xad": ""})
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKC", text or "").translate(PUNCTUATION)
+    return HYPHENATED_BREAK.sub(r"\1\2", text).lower()
+
+
+def tokens(text):
+    return WORD.findall(normalize(text))
+
+
+def _mult(m, n):
+    # 2D affine matrix product (PDF [a b c d e f] layout)
+    return [
+        m[0] * n[0] + m[1] * n[2],
+        m[0] * n[1] + m[1] * n[3],
+        m[2] * n[0] + m[3] * n[2],
+        m[2] * n[1] + m[3] * n[3],
+        m[4] * n[0] + m[5] * n[2] + n[4],
+        m[4] * n[1] + m[5] * n[3] + n[5],
+    ]
+
+
+def _extract_pdf(data):
+    """Per-page text plus the positioned text runs pypdf reports for each page."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(io.BytesIO(data))
+    pages, layouts = [], []
+    for page in reader.pages:
+        runs = []
+
+        def visit(text, cm, tm, font_dict, font_size):
+            if not text.strip():
+                return
+            m = _mult(tm, cm)
+            runs.append((text, m[4], m[5], font_size * abs(m[3] or m[0]) or font_size))
+
+        pages.append(page.extract_text(visitor_text=visit) or "")
+        box = page.mediabox
+        layouts.append({"left": float(box.left), "top": float(box.top), "runs": runs})
+    return pages, layouts
+
+
+def _word_boxes(words, layout):
+    """Estimate a [x, y, width, height] box (top-left origin) for each word.
+
+    Word positions inside a run are interpolated from an average glyph width,
+    which is close enough to highlight a passage. Run words are aligned to
+    the page's words because hyphenation and spacing can differ slightly.
+    """
+    run_words, run_boxes = [], []
+    for text, x, y, size in layout["runs"]:
+        char_width = size * 0.5
+        top = layout["top"] - y - size * 0.85
+        for m in WORD.finditer(normalize(text)):
+            run_words.append(m.group())
+            run_boxes.append([
+                round(x - layout["left"] + m.start() * char_width, 1),
+                round(top, 1),
+                round(len(m.group()) * char_width, 1),
+                round(size * 1.15, 1),
+            ])
+    boxes = [None] * len(words)
+    matcher = SequenceMatcher(None, words, run_words, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag in ("equal", "replace") and j2 > j1:
+            for i in range(i1, i2):
+                boxes[i] = run_boxes[min(j1 + (i - i1) * (j2 - j1) // max(i2 - i1, 1), j2 - 1)]
+    # Words the runs didn't account for borrow their neighbour's box
+    last = None
+    for i, box in enumerate(boxes):
+        if box is None:
+            boxes[i] = last
+        else:
+            last = box
+    return boxes
+
+
+def _cache_key(digest, version):
+    return f"{digest}.v{version}.json"
+
+
+def load_document(data, digest):
+    """Per-page text and per-word boxes of a PDF (see indexable()).
+
+    Both come from the shared on-disk cache when possible; otherwise they
+    are extracted in a single pypdf pass and cached by content hash. The
+    extraction holds the cache lock for the document, so server processes
+    opening the same document at once extract it only once.
+    """
+    text_key = _cache_key(digest, TEXT_VERSION)
+    positions_key = _cache_key(digest, POSITIONS_VERSION)
+
+    def cached():
+        text = shared_cache.get_json("text", text_key)
+        positions = shared_cache.get_json("positions", positions_key) if text else None
+        if text and positions:
+            return text["pages"], positions["pages"]
+        return None
+
+    found = cached()
+    if found:
+        return found
+    with shared_cache.lock("text", text_key):
+        found = cached()
+        if found:
+            return found
+        pages, layouts = _extract_pdf(data)
+        boxes = [_word_boxes(tokens(page), layout) for page, layout in zip(pages, layouts)]
+        shared_cache.put_json("positions", positions_key, {"pages": boxes})
+        shared_cache.put_json("text", text_key, {"pages": pages})
+    return pages, boxes
+
+
+class TextIndex:
+    def __init__(self, pages, boxes=None):
+        self.words = []
+        self.page_starts = []  # index of the first word on each page
+        for page in pages:
+            self.page_starts.append(len(self.words))
+            self.words.extend(tokens(page))
+        self.page_count = len(pages)
+        # One [x, y, width, height] per word, or None when positions are unknown
+        self.boxes = [box for page_boxes in boxes for box in page_boxes] if boxes else None
+
+        # " word word ... " with the character offset of every word, for exact search
+        self.joined = " " + " ".join(self.words) + " "
+        self.char_starts = []
+        offset = 1
+        for w in self.words:
+            self.char_starts.append(offset)
+            offset += len(w) + 1
+
+        self.trigrams = defaultdict(list)
+        for i in range(len(self.words) - 2):
+            self.trigrams[(self.words[i], self.words[i + 1], self.words[i + 2])].append(i)
+        # Word positions, for evidence too short to share a trigram with the text
+        self.unigrams = defaultdict(list)
+        for i, w in enumerate(self.words):
+            self.unigrams[w].append(i)
+
+    def page_of(self, word_index):
+        """1-based page number of a word."""
+        return bisect_right(self.page_starts, word_index)
+
+    def _exact(self, words):
+        pos = self.joined.find(" " + " ".join(words) + " ")
+        if pos < 0:
+            return None
+        return bisect_right(self.char_starts, pos + 1) - 1
+
+    def _votes(self, words, n):
+        # Alignments (start of the evidence in the text) voted for by shared n-grams
+        index = self.trigrams if n == 3 else self.unigrams
+        votes = Counter()
+        for offset in range(len(words) - n + 1):
+            gram = tuple(words[offset:offset + n]) if n == 3 else words[offset]
+            for pos in index.get(gram, ()):
+                votes[pos - offset] += 1
+        return votes
+
+    def _fuzzy(self, words):
+        # Short evidence, or evidence where every trigram has a changed word
+        # ("generative AI 1" vs "generative AI 2"), falls back to single words
+        votes = self._votes(words, 3) or self._votes(words, 1)
+        if not votes:
+            return None, 0.0
+        # Allow a few inserted/dropped words by pooling nearby alignments
+        starts = sorted(votes)
+        best_start, best = None, 0
+        lo = 0
+        pooled = 0
+        for hi, start in enumerate(starts):
+            pooled += votes[start]
+            while start - starts[lo] > 6:
+                pooled -= votes[starts[lo]]
+                lo += 1
+            if pooled > best:
+                best, best_start = pooled, starts[lo]
+        # Score the aligned window word by word, so one changed word costs one
+        # word rather than the three trigrams that contain it
+        start = max(best_start, 0)
+        window = self.words[start:start + len(words) + len(words) // 4 + 3]
+        matcher = SequenceMatcher(None, words, window, autojunk=False)
+        matched = sum(block.size for block in matcher.get_matching_blocks())
+        return start, matched / len(words)
+
+    def locate(self, evidence):
+        """Match each pasted passage of evidence.
+
+        Returns a list of (start_word, word_count, score) per passage; start_word
+        is None when nothing similar was found.
+        """
+        matches = []
+        for segment in SEGMENT_BREAK.split(evidence or ""):
+            words = tokens(segment)
+            if not words:
+                continue
+            start = self._exact(words)
+            if start is not None:
+                matches.append((start, len(words), 1.0))
+            else:
+                start, score = self._fuzzy(words)
+                matches.append((start, len(words), score))
+        return matches
+
+    def verify(self, evidence):
+        """Summarize how well the evidence matches the document text.
+
+        Returns {"found", "page", "score"} or None for empty evidence; score is
+        the share of evidence words found, in order, in the best-matching passage.
+        """
+        matches = self.locate(evidence)
+        if not matches:
+            return None
+        total = sum(n for _, n, _ in matches)
+        score = sum(n * s for _, n, s in matches) / total
+        located = [start for start, _, s in matches if start is not None and s > 0]
+        return {
+            "found": score >= config.EVIDENCE_MATCH_THRESHOLD,
+            "page": self.page_of(located[0]) if located else None,
+            "score": round(score, 3),
+        }
+
+
+    def highlights(self, evidence, min_score=0.5, color="rgba(255, 214, 0, 0.9)"):
+        """pdf_viewer annotations covering the passages that match the evidence.
+
+        Consecutive words on the same line are merged into one rectangle;
+        passages scoring below min_score are not highlighted.
+        """
+        if not self.boxes:
+            return []
+        annotations = []
+        for start, count, score in self.locate(evidence):
+            if start is None or score < min_score:
+                continue
+            current = None
+            for i in range(start, min(start + count, len(self.words))):
+                box = self.boxes[i]
+                if box is None:
+                    continue
+                page = self.page_of(i)
+                x, y, w, h = box
+                if current and current["page"] == page and abs(current["y"] - y) < h / 2 and x >= current["x"]:
+                    current["width"] = max(current["width"], x + w - current["x"])
+                    continue
+                current = {"page": page, "x": x, "y": y, "width": w, "height": h, "color": color}
+                annotations.append(current)
+        return annotations
+
+
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=config.TEXT_INDEX_WORKERS, thread_name_prefix="textindex")
+_jobs = {}  # document key -> Future
+_indexes = OrderedDict()  # document key -> TextIndex
+_failed = OrderedDict()  # document key -> error message
+
+
+class ExtractionFailed(Exception):
+    """The document's text could not be extracted."""
+
+
+def _build(key):
+    data = doc_cache.read(key[0])
+    pages, boxes = load_document(data, doc_cache.digest(key[0]))
+    return TextIndex(pages, boxes)
+
+
+def _finished(key, future):
+    error = future.exception()
+    with _lock:
+        _jobs.pop(key, None)
+        if error is None:
+            _indexes[key] = future.result()
+            while len(_indexes) > MAX_INDEXES:
+                _indexes.popitem(last=False)
+        else:
+            _failed[key] = str(error) or type(error).__name__
+            while len(_failed) > MAX_FAILED:
+                _failed.popitem(last=False)
+    if error is not None:
+        logger.warning("Extracting text from %s failed: %s", key[0], error)
+
+
+def indexable(path):
+    """Only PDFs are indexed: a TextIndex holds all of a document's words in
+    memory, and plain-text documents can be far larger (see textview.py)."""
+    return path.lower().endswith(".pdf")
+
+
+def get_index(path, wait=False):
+    """Return the TextIndex for a document, or None while it is being built.
+
+    The first call starts extraction in the background; concurrent callers
+    for the same document share one job. Raises ExtractionFailed if the text
+    of this version of the file could not be extracted, and ValueError for
+    documents that are not indexable().
+    """
+    if not indexable(path):
+        raise ValueError(f"Only PDF documents are indexed: {path}")
+    key = doc_cache.DocumentCache.key_for(path)
+    with _lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+        if key in _failed:
+            raise ExtractionFailed(_failed[key])
+        future = _jobs.get(key)
+        submitted = future is None
+        if submitted:
+            future = _executor.submit(_build, key)
+            _jobs[key] = future
+    # Outside the lock: a job that already finished runs the callback right
+    # here, and _finished takes the lock itself
+    if submitted:
+        future.add_done_callback(lambda f: _finished(key, f))
+    if wait:
+        try:
+            return future.result()
+        except Exception as e:
+            raise ExtractionFailed(str(e) or type(e).__name__) from e
+    return None
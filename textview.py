@@ -0,0 +1,144 @@
+"""Paged access to large plain-text documents (txt, Markdown, HTML exports).
+
+A document is split into pages of at most TEXT_PAGE_LINES lines and
+TEXT_PAGE_BYTES bytes. One sequential pass records the byte offset where
+each page starts; the offsets are cached in memory and in the shared
+on-disk cache, keyed by path + mtime + size. Showing a page then reads just
+that byte range, and search streams the file in fixed-size blocks, so
+memory stays flat whatever the file size.
+"""
+import hashlib
+import os
+from array import array
+from bisect import bisect_right
+from collections import Counter
+from functools import lru_cache
+
+import config
+import doc_cache
+import shared_cache
+
+# Bump whenever the index layout or paging rules change
+INDEX_VERSION = 1
+
+BLOCK_BYTES = 1 << 20
+
+
+def is_text(path, sniff_bytes=8192):
+    """False for binary files (anything with a NUL byte near the start)."""
+    with open(path, "rb") as f:
+        return b"\0" not in f.read(sniff_bytes)
+
+
+def _page_end(buf, pos, eof, lines, page_bytes):
+    """End (exclusive) of the page starting at buf[pos]."""
+    limit = min(len(buf), pos + page_bytes)
+    end = pos - 1
+    for _ in range(lines):
+        end = buf.find(b"\n", end + 1, limit)
+        if end < 0:
+            break
+    else:
+        return end + 1
+    if eof and limit == len(buf):
+        return limit
+    # Page is full by bytes: cut after the last complete line, or inside an
+    # overlong line but never in the middle of a UTF-8 sequence
+    last = buf.rfind(b"\n", pos, limit)
+    if last >= 0:
+        return last + 1
+    while limit > pos + 1 and (buf[limit] & 0xC0) == 0x80:
+        limit -= 1
+    return limit
+
+
+def _scan(path, lines, page_bytes):
+    offsets = array("Q", [0])
+    with open(path, "rb") as f:
+        buf = b""
+        pos = 0
+        base = 0  # file offset of buf[0]
+        eof = False
+        while True:
+            if len(buf) - pos <= page_bytes and not eof:
+                more = f.read(BLOCK_BYTES)
+                base += pos
+                buf = buf[pos:] + more
+                pos = 0
+                eof = not more
+                continue
+            if pos >= len(buf):
+                break
+            pos = _page_end(buf, pos, eof, lines, page_bytes)
+            if pos < len(buf) or not eof:
+                offsets.append(base + pos)
+    # A file ending exactly on a page boundary has no empty last page
+    size = os.path.getsize(path)
+    while len(offsets) > 1 and offsets[-1] >= size:
+        offsets.pop()
+    return offsets
+
+
+@lru_cache(maxsize=256)
+def _offsets(key, lines, page_bytes):
+    # Keyed by path + mtime + size rather than content, so opening a large
+    # file never means hashing all of it first
+    name = hashlib.sha1(repr((key, lines, page_bytes, INDEX_VERSION)).encode()).hexdigest()
+    offsets = array("Q")
+    offsets.frombytes(shared_cache.get_or_build(
+        "textview", f"{name}.idx", lambda: _scan(key[0], lines, page_bytes).tobytes()
+    ))
+    return offsets
+
+
+def page_offsets(path):
+    """Byte offset of the start of every page, built once per file version."""
+    key = doc_cache.DocumentCache.key_for(path)
+    return _offsets(key, config.TEXT_PAGE_LINES, config.TEXT_PAGE_BYTES)
+
+
+def page_count(path):
+    return len(page_offsets(path))
+
+
+def read_page(path, page):
+    """Text of one page (1-based)."""
+    offsets = page_offsets(path)
+    start = offsets[page - 1]
+    end = offsets[page] if page < len(offsets) else None
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start) if end is not None else f.read()
+    return data.decode("utf-8", errors="replace")
+
+
+def search(path, query, limit=1000):
+    """Pages containing query, as [(page, matches)] in page order.
+
+    Case-insensitive for ASCII letters. The file is read in BLOCK_BYTES
+    blocks (keeping len(query) - 1 bytes of overlap), and counting stops
+    after `limit` matches.
+    """
+    needle = (query or "").encode("utf-8").lower()
+    if not needle:
+        return []
+    offsets = page_offsets(path)
+    counts = Counter()
+    found = 0
+    keep = len(needle) - 1
+    with open(path, "rb") as f:
+        carry = b""
+        base = 0  # file offset of carry[0]
+        while found < limit:
+            block = f.read(BLOCK_BYTES)
+            if not block:
+                break
+            data = carry + block.lower()
+            i = data.find(needle)
+            while i >= 0 and found < limit:
+                counts[bisect_right(offsets, base + i)] += 1
+                found += 1
+                i = data.find(needle, i + len(needle))
+            carry = data[len(data) - keep:] if keep else b""
+            base += len(data) - len(carry)
+    return sorted(counts.items())